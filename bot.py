@@ -1,22 +1,48 @@
 import time
 import json
 import os
+import asyncio
+import inspect
 import argparse
 import logging
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from utils import read_products, Product
-from llm import generate_tweet
+from llm import generate_tweet, generate_tweets, async_generate_tweets, LLM_CONCURRENCY
 from twitter_client import TwitterClient
 from threads_client import ThreadsClient
-from fetch_deals import fetch_deals, write_to_csv
+from rate_limit import RateLimitExceeded
+from price_history import PriceHistory
+from feed_scheduler import FeedScheduler
+from snapshot import Snapshot, publish_snapshot, republish, snapshot_path
+from profiling import Profiler, PROFILE_DIR
+from fetch_deals import fetch_deals, async_fetch_deals, write_to_csv, FEED_CONCURRENCY
 
 logger = logging.getLogger(__name__)
 
 
 POSTED_DB = "posted.json"
 LAST_RUN_FILE = "last_run.txt"
+# A posted product is re-posted when its price falls below the posted price and is the
+# lowest seen in this many days.
+REPOST_LOOKBACK_DAYS = int(os.getenv("REPOST_LOOKBACK_DAYS", "30"))
+# Shortest sleep in run_loop when waiting for the posting budget to reopen
+MIN_SLOT_WAIT_SECONDS = 5
+# Posts allowed in flight at once from async_run_once
+POST_CONCURRENCY = int(os.getenv("POST_CONCURRENCY", "1"))
+
+
+@dataclass
+class AsyncLimits:
+	"""Concurrency limits for async_run_once. Create one per event loop and pass it to
+	every bot so the caps hold across all of them, not per bot."""
+
+	posts: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(POST_CONCURRENCY))
+	llm: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(LLM_CONCURRENCY))
+	feeds: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(FEED_CONCURRENCY))
 
 
 class Bot:
@@ -24,6 +50,14 @@ class Bot:
 		self.products_csv = products_csv
 		self.client = twitter_client
 		self.posted = self._load_posted()
+		self.history = PriceHistory()
+		self.feed_scheduler = FeedScheduler()
+		# generated copy awaiting a posting slot, keyed by (url, deal_price) so a price
+		# change never reuses copy that quotes the old price
+		self.drafts: Dict[Tuple[str, Optional[float]], str] = {}
+		self._snapshot: Optional[Snapshot] = None
+		# async posts persist from worker threads; one writer at a time
+		self._io_lock = threading.Lock()
 
 	def _load_posted(self):
 		if os.path.exists(POSTED_DB):
@@ -36,59 +70,260 @@ class Bot:
 
 	def _save_posted(self):
 		with open(POSTED_DB, "w", encoding="utf-8") as fh:
-			json.dump(self.posted, fh, indent=2)
+			json.dump(dict(self.posted), fh, indent=2)
+
+	def _publish_snapshot(self):
+		# let the health server and other readers see new products and posted flags
+		try:
+			snap = self._snapshot
+			if snap is not None and snap.matches_csv(self.products_csv):
+				# products are unchanged, only the posted flags need updating
+				republish(snap, self.posted)
+			else:
+				publish_snapshot(self.products_csv, self.posted)
+		except Exception:
+			logger.exception("Failed to publish product snapshot")
+
+	def _current_snapshot(self) -> Optional[Snapshot]:
+		"""Return the mapped snapshot of products_csv, republishing it if the CSV has changed since.
+
+		Returns None if no up-to-date snapshot could be published.
+		"""
+		snap = self._snapshot.refresh() if self._snapshot is not None else Snapshot.open(snapshot_path(self.products_csv))
+		if snap is None or not snap.matches_csv(self.products_csv):
+			self._publish_snapshot()
+			snap = snap.refresh() if snap is not None else Snapshot.open(snapshot_path(self.products_csv))
+		self._snapshot = snap
+		return snap if snap is not None and snap.matches_csv(self.products_csv) else None
 
 	def select_products(self) -> List[Product]:
-		prods, errs = read_products(self.products_csv)
-		# simple: skip any product whose url was posted before
-		filtered = [p for p in prods if p.url not in self.posted]
+		snap = self._current_snapshot()
+		if snap is not None:
+			prods = list(snap.products())
+		else:
+			prods, errs = read_products(self.products_csv)
+		# pick up prices recorded by other processes once, then query in memory
+		self.history.refresh()
+		# skip any product whose url was posted before, unless its price has genuinely dropped since
+		filtered = []
+		for p in prods:
+			# self.posted also covers posts made since the snapshot was published
+			posted = snap.is_posted(p.url) if snap is not None else False
+			if not posted and p.url not in self.posted:
+				filtered.append(p)
+				continue
+			new_price = self.history.price_drop(p.url, REPOST_LOOKBACK_DAYS)
+			if new_price is not None:
+				p.deal_price = new_price
+				filtered.append(p)
 		return filtered
 
+	def next_post_at(self) -> float:
+		"""Epoch time of the client's next posting slot; clients without rate limiting are always ready."""
+		next_post_at = getattr(self.client, "next_post_at", None)
+		return next_post_at() if next_post_at else time.time()
+
+	@staticmethod
+	def _draft_key(product: Product) -> Tuple[str, Optional[float]]:
+		return product.url, product.deal_price
+
+	def _draft(self, product: Product) -> str:
+		key = self._draft_key(product)
+		if key not in self.drafts:
+			self.drafts[key] = generate_tweet(product)
+		return self.drafts[key]
+
+	def _draft_many(self, products: List[Product]):
+		"""Generate copy for all undrafted products in as few LLM calls as possible."""
+		pending = [p for p in products if self._draft_key(p) not in self.drafts]
+		if pending:
+			for p, text in zip(pending, generate_tweets(pending)):
+				self.drafts[self._draft_key(p)] = text
+
 	def post_product(self, product: Product) -> bool:
-		tweet = generate_tweet(product)
+		"""Post one product. Raises RateLimitExceeded (keeping the draft) when out of budget."""
+		if inspect.iscoroutinefunction(self.client.post_tweet):
+			raise TypeError(f"{type(self.client).__name__} is asynchronous; use async_run_once")
+		tweet = self._draft(product)
 		try:
 			resp = self.client.post_tweet(tweet)
-			# record posted time
-			self.posted[product.url] = {
-				"title": product.title,
-				"tweet_id": resp.get("id") if isinstance(resp, dict) else None,
-				"posted_at": datetime.now(timezone.utc).isoformat(),
-			}
+			self._record_post(product, resp)
+			return True
+		except RateLimitExceeded:
+			raise
+		except Exception as e:
+			print(f"Failed to post {product.url}: {e}")
+			return False
+
+	def _record_post(self, product: Product, resp):
+		self._remember_post(product, resp)
+		self._persist_post(product)
+
+	def _remember_post(self, product: Product, resp):
+		# record posted time
+		self.posted[product.url] = {
+			"title": product.title,
+			"tweet_id": resp.get("id") if isinstance(resp, dict) else None,
+			"posted_at": datetime.now(timezone.utc).isoformat(),
+		}
+		# drop every draft for this url, including ones written for an older price
+		self.drafts = {k: v for k, v in self.drafts.items() if k[0] != product.url}
+
+	def _persist_post(self, product: Product):
+		with self._io_lock:
 			self._save_posted()
+			self.history.mark_posted(product.url, product.deal_price or product.price)
 			# update last run marker
 			try:
 				with open(LAST_RUN_FILE, "w", encoding="utf-8") as fh:
 					fh.write(datetime.now(timezone.utc).isoformat())
 			except Exception:
 				logger.exception("Failed to write last run file")
+
+	async def _async_draft_many(self, products: List[Product], session, limits: AsyncLimits):
+		pending = [p for p in products if self._draft_key(p) not in self.drafts]
+		if pending:
+			for p, text in zip(pending, await async_generate_tweets(pending, session=session, sem=limits.llm)):
+				self.drafts[self._draft_key(p)] = text
+
+	async def _async_post_product(self, product: Product, session, limits: AsyncLimits) -> bool:
+		"""asyncio variant of post_product. Blocking clients and file I/O run in a worker thread."""
+		await self._async_draft_many([product], session, limits)
+		tweet = self.drafts[self._draft_key(product)]
+		try:
+			if inspect.iscoroutinefunction(self.client.post_tweet):
+				resp = await self.client.post_tweet(tweet)
+			else:
+				resp = await asyncio.to_thread(self.client.post_tweet, tweet)
+			self._remember_post(product, resp)
+			await asyncio.to_thread(self._persist_post, product)
 			return True
+		except RateLimitExceeded:
+			raise
 		except Exception as e:
 			print(f"Failed to post {product.url}: {e}")
 			return False
 
 	def _refresh_deals(self):
-		rows = fetch_deals()
+		rows = fetch_deals(history=self.history, scheduler=self.feed_scheduler)
 		added = write_to_csv(rows, self.products_csv)
 		if added:
+			# select_products republishes the snapshot once it sees the CSV has changed
 			logger.info("Fetched %d new deals into %s", added, self.products_csv)
 
-	def run_once(self, limit: int = 1):
+	def run_once(self, limit: int = 1) -> Optional[float]:
+		"""Refresh deals and post up to `limit` products.
+
+		Returns the epoch time of the next posting slot when the posting budget ran out,
+		otherwise None.
+		"""
 		self._refresh_deals()
 		products = self.select_products()
+		next_slot = self.next_post_at()
+		if next_slot > time.time():
+			# keep generating copy so the next slot can be used straight away
+			self._draft_many(products[:limit])
+			logger.info(
+				"Posting budget exhausted; next slot at %s",
+				datetime.fromtimestamp(next_slot, timezone.utc).isoformat(),
+			)
+			return next_slot
+		self._draft_many(products[:limit])
 		posted = 0
+		retry_at = None
 		for p in products:
 			if posted >= limit:
 				break
-			ok = self.post_product(p)
+			try:
+				ok = self.post_product(p)
+			except RateLimitExceeded as e:
+				logger.info("%s", e)
+				retry_at = e.retry_at
+				break
 			if ok:
 				posted += 1
+		if posted:
+			# one publish per run, not per post
+			self._publish_snapshot()
+		return retry_at
+
+	async def _async_refresh_deals(self, session, limits: AsyncLimits):
+		rows = await async_fetch_deals(
+			history=self.history, scheduler=self.feed_scheduler, session=session, sem=limits.feeds
+		)
+		added = await asyncio.to_thread(write_to_csv, rows, self.products_csv)
+		if added:
+			# select_products republishes the snapshot once it sees the CSV has changed
+			logger.info("Fetched %d new deals into %s", added, self.products_csv)
+
+	async def async_run_once(
+		self, limit: int = 1, session=None, limits: Optional[AsyncLimits] = None
+	) -> Optional[float]:
+		"""asyncio variant of run_once.
+
+		Feed refresh runs as a task while copy is drafted for the products already known;
+		posts then go out in waves until `limit` succeed. Feed downloads, LLM batches and
+		posts are bounded by `limits`; pass the same AsyncLimits (and aiohttp `session`)
+		to every bot in the process to share the caps and connections. File I/O runs in
+		worker threads. Returns the next posting slot when the budget ran out, like run_once.
+		"""
+		limits = limits or AsyncLimits()
+		refresh = asyncio.create_task(self._async_refresh_deals(session, limits))
+		try:
+			known = await asyncio.to_thread(self.select_products)
+			await self._async_draft_many(known[:limit], session, limits)
+		finally:
+			await refresh
+		products = await asyncio.to_thread(self.select_products)
+		next_slot = self.next_post_at()
+		if next_slot > time.time():
+			await self._async_draft_many(products[:limit], session, limits)
+			logger.info(
+				"Posting budget exhausted; next slot at %s",
+				datetime.fromtimestamp(next_slot, timezone.utc).isoformat(),
+			)
+			return next_slot
+
+		async def post(p: Product) -> bool:
+			async with limits.posts:
+				return await self._async_post_product(p, session, limits)
+
+		posted = 0
+		retry_at = None
+		queue = list(products)
+		while posted < limit and queue:
+			wave, queue = queue[: limit - posted], queue[limit - posted:]
+			await self._async_draft_many(wave, session, limits)
+			results = await asyncio.gather(*(post(p) for p in wave), return_exceptions=True)
+			for r in results:
+				if isinstance(r, BaseException) and not isinstance(r, RateLimitExceeded):
+					raise r
+			posted += sum(1 for r in results if r is True)
+			limited = [r for r in results if isinstance(r, RateLimitExceeded)]
+			if limited:
+				logger.info("%s", limited[0])
+				retry_at = limited[0].retry_at
+				break
+		if posted:
+			await asyncio.to_thread(self._publish_snapshot)
+		return retry_at
+
+	def run_loop(self, interval_minutes: int = 60, per_run: int = 1, profiler: Profiler = None):
+		"""Run forever. Iterations are profiled per `profiler`, which also picks up a
+		PROFILE_TRIGGER_FILE created while the loop is running.
 
-	def run_loop(self, interval_minutes: int = 60, per_run: int = 1):
+		Sleeps `interval_minutes` between runs, or less when the posting budget
+		reopens sooner."""
 		logger.info("Starting loop: every %d minutes, %d posts per run", interval_minutes, per_run)
+		profiler = profiler or Profiler()
 		try:
 			while True:
-				self.run_once(limit=per_run)
-				time.sleep(interval_minutes * 60)
+				with profiler.profile("run_once"):
+					next_slot = self.run_once(limit=per_run)
+				delay = interval_minutes * 60
+				if next_slot is not None:
+					delay = min(delay, max(next_slot - time.time(), MIN_SLOT_WAIT_SECONDS))
+				time.sleep(delay)
 		except KeyboardInterrupt:
 			logger.info("Stopping loop")
 
@@ -99,6 +334,10 @@ def main():
 	parser.add_argument("--once", action="store_true", help="Run a single posting run and exit")
 	parser.add_argument("--limit", type=int, default=1, help="Number of posts per run")
 	parser.add_argument("--interval", type=int, default=60, help="Minutes between runs when running continuously")
+	parser.add_argument("--profile", action="store_true", help="Write cProfile stats and collapsed stacks for each run")
+	parser.add_argument("--profile-memory", action="store_true", help="Write tracemalloc top allocators for each run")
+	parser.add_argument("--profile-sample", type=float, default=1.0, help="Fraction of runs to profile (0-1)")
+	parser.add_argument("--profile-dir", default=PROFILE_DIR, help="Directory for profiling output")
 	args = parser.parse_args()
 
 	logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
@@ -109,11 +348,15 @@ def main():
 	else:
 		client = ThreadsClient()
 	bot = Bot(args.csv, client)
+	profiler = Profiler(
+		out_dir=args.profile_dir, cpu=args.profile, memory=args.profile_memory, sample_rate=args.profile_sample
+	)
 
 	if args.once:
-		bot.run_once(limit=args.limit)
+		with profiler.profile("run_once"):
+			bot.run_once(limit=args.limit)
 	else:
-		bot.run_loop(interval_minutes=args.interval, per_run=args.limit)
+		bot.run_loop(interval_minutes=args.interval, per_run=args.limit, profiler=profiler)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+"""feed_scheduler.py — Per-feed adaptive polling intervals, persisted across restarts."""
+
+import json
+import os
+import time
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from price_history import product_key
+
+logger = logging.getLogger(__name__)
+
+FEED_STATE_FILE = os.getenv("FEED_STATE_FILE", "feed_state.json")
+FEED_MIN_INTERVAL_MINUTES = float(os.getenv("FEED_MIN_INTERVAL_MINUTES", "15"))
+FEED_MAX_INTERVAL_MINUTES = float(os.getenv("FEED_MAX_INTERVAL_MINUTES", "720"))
+# Aim for roughly this many new entries per poll: busy feeds are polled often, quiet ones rarely
+FEED_TARGET_NEW_PER_POLL = float(os.getenv("FEED_TARGET_NEW_PER_POLL", "3"))
+
+# Weight of the latest observation in the new-item rate moving average
+RATE_ALPHA = 0.3
+# Entry keys remembered per feed to tell new entries from repeats
+MAX_SEEN = 200
+
+
+@dataclass
+class FeedState:
+    interval: float  # seconds between successful polls
+    next_poll_at: float = 0.0
+    last_poll_at: Optional[float] = None
+    rate: Optional[float] = None  # moving average of new entries per second
+    errors: int = 0  # consecutive failures
+    seen: List[int] = field(default_factory=list)
+
+
+class FeedScheduler:
+    """Decide which feeds are due and adapt each feed's interval to its observed turnover.
+
+    A feed's interval is FEED_TARGET_NEW_PER_POLL divided by its new-item rate, clamped
+    to [min_interval, max_interval]. Failing feeds back off exponentially from their
+    current interval, up to max_interval.
+
+    The bot and the fetch_deals CLI may share `state_file`: state is re-read before each
+    `due()` and `save()` only writes back the feeds this process polled.
+    """
+
+    def __init__(
+        self,
+        state_file: Optional[str] = FEED_STATE_FILE,
+        min_interval: float = FEED_MIN_INTERVAL_MINUTES * 60,
+        max_interval: float = FEED_MAX_INTERVAL_MINUTES * 60,
+        target_new: float = FEED_TARGET_NEW_PER_POLL,
+    ):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.feeds: Dict[str, FeedState] = {}
+        # feeds updated since the last save; only these are written back
+        self._dirty: Set[str] = set()
+        self._load()
+
+    def _read_state(self) -> Dict[str, FeedState]:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            return {url: FeedState(**raw) for url, raw in data.items()}
+        except Exception:
+            logger.warning("Ignoring unreadable feed state in %s", self.state_file)
+            return {}
+
+    def _load(self):
+        """Take the latest on-disk state for every feed this process has not updated since saving."""
+        if not self.state_file:
+            return
+        latest = self._read_state()
+        for url in self._dirty:
+            latest[url] = self.feeds[url]
+        self.feeds = latest
+
+    def save(self):
+        """Merge this process's updates into the state file, replacing it atomically."""
+        if not self.state_file:
+            self._dirty.clear()
+            return
+        self._load()
+        tmp = f"{self.state_file}.tmp{os.getpid()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({url: asdict(st) for url, st in self.feeds.items()}, fh, indent=2)
+            os.replace(tmp, self.state_file)
+            self._dirty.clear()
+        except Exception:
+            logger.exception("Failed to write feed state")
+
+    def _state(self, feed: str) -> FeedState:
+        if feed not in self.feeds:
+            self.feeds[feed] = FeedState(interval=self.min_interval)
+        self._dirty.add(feed)
+        return self.feeds[feed]
+
+    def _clamp(self, seconds: float) -> float:
+        return max(self.min_interval, min(self.max_interval, seconds))
+
+    def due(self, feeds: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """Return the feeds whose next poll time has passed (new feeds are always due)."""
+        now = time.time() if now is None else now
+        self._load()
+        return [f for f in feeds if f not in self.feeds or self.feeds[f].next_poll_at <= now]
+
+    def record_success(self, feed: str, entry_urls: Iterable[str], now: Optional[float] = None) -> int:
+        """Update a feed after a successful poll. Returns the number of entries not seen before."""
+        now = time.time() if now is None else now
+        st = self._state(feed)
+        keys = [product_key(u) for u in entry_urls if u]
+        seen = set(st.seen)
+        new = sum(1 for k in keys if k not in seen)
+
+        if st.last_poll_at is not None:
+            observed = new / max(now - st.last_poll_at, 1.0)
+            st.rate = observed if st.rate is None else RATE_ALPHA * observed + (1 - RATE_ALPHA) * st.rate
+            if st.rate > 0:
+                st.interval = self._clamp(self.target_new / st.rate)
+            else:
+                st.interval = self._clamp(st.interval * 2)
+
+        fresh = set(keys)
+        st.seen = (keys + [k for k in st.seen if k not in fresh])[:MAX_SEEN]
+        st.errors = 0
+        st.last_poll_at = now
+        st.next_poll_at = now + st.interval
+        return new
+
+    def record_error(self, feed: str, now: Optional[float] = None):
+        """Back off a failing feed: the wait doubles with each consecutive error."""
+        now = time.time() if now is None else now
+        st = self._state(feed)
+        st.errors += 1
+        st.next_poll_at = now + self._clamp(st.interval * 2 ** st.errors)
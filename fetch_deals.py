@@ -3,11 +3,28 @@
 import csv
 import os
 import re
+import asyncio
+import logging
 import argparse
 import feedparser
 
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+from price_history import PriceHistory
+from feed_scheduler import FeedScheduler
+from snapshot import Snapshot, load_posted, publish_snapshot, snapshot_path
+from profiling import Profiler, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
 PRODUCTS_CSV = "products.csv"
+POSTED_DB = os.getenv("POSTED_DB", "posted.json")
 FIELDNAMES = ["title", "url", "price", "deal_price", "currency", "image_url", "tags"]
+# Feed downloads allowed in flight at once from async_fetch_deals
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", "4"))
 
 # --- Feed configuration ---
 # SlickDeals supports per-keyword RSS search. Set SLICKDEALS_KEYWORDS in your .env
@@ -102,52 +119,149 @@ def load_existing_urls(path: str) -> set:
         return {row.get("url", "") for row in reader}
 
 
-def fetch_deals(feeds=None, limit=50, tags="tech") -> list:
-    """Fetch entries from RSS feeds. Returns list of row dicts."""
-    feeds = feeds or _build_feeds()
+def _due_feeds(feeds: list, scheduler: FeedScheduler = None) -> list:
+    if scheduler is None:
+        return feeds
+    due = scheduler.due(feeds)
+    if len(due) < len(feeds):
+        print(f"Skipping {len(feeds) - len(due)} feed(s) not yet due")
+    return due
+
+
+def _collect_entries(feed_url, parsed, limit, tags, rows, seen_urls, scheduler: FeedScheduler = None):
+    """Append tech deals from one parsed feed to `rows` and report the poll to `scheduler`."""
+    if parsed.bozo:
+        print(f"  Warning: feed parse issue — {parsed.bozo_exception}")
+    entries = parsed.entries[:limit]
+    print(f"  Got {len(entries)} entries")
+    if scheduler is not None:
+        if parsed.get("status", 200) >= 400 or (parsed.bozo and not entries):
+            scheduler.record_error(feed_url)
+        else:
+            new = scheduler.record_success(feed_url, [e.get("link", "").strip() for e in entries])
+            print(f"  {new} new since last poll")
+
+    for entry in entries:
+        url = entry.get("link", "").strip()
+        if not url or url in seen_urls:
+            continue
+
+        title = entry.get("title", "").strip()
+        summary = entry.get("summary", "") or ""
+
+        if not _is_tech(title, summary):
+            continue
+
+        # Price extraction: first price in title is usually deal price
+        deal_price = _extract_price(title) or _extract_price(summary)
+        original_price = _extract_original_price(title) or _extract_original_price(summary)
+
+        rows.append({
+            "title": title,
+            "url": url,
+            "price": original_price or "",
+            "deal_price": deal_price or "",
+            "currency": "$" if (deal_price or original_price) else "",
+            "image_url": _extract_image(entry),
+            "tags": tags,
+        })
+        seen_urls.add(url)
+
+
+def _finish_fetch(rows, history: PriceHistory = None, scheduler: FeedScheduler = None):
+    if history is not None:
+        history.record_prices((r["url"], r["deal_price"] or r["price"]) for r in rows)
+    if scheduler is not None:
+        scheduler.save()
+
+
+def fetch_deals(feeds=None, limit=50, tags="tech", history: PriceHistory = None, scheduler: FeedScheduler = None) -> list:
+    """Fetch entries from RSS feeds. Returns list of row dicts.
+
+    When `history` is given, every priced deal seen (including ones already in the CSV)
+    is recorded there so later price drops can be detected. When `scheduler` is given,
+    only feeds that are due are polled and each feed's outcome is reported back to it.
+    """
+    feeds = _due_feeds(feeds or _build_feeds(), scheduler)
     rows = []
     seen_urls = set()
 
     for feed_url in feeds:
         print(f"Fetching: {feed_url}")
         parsed = feedparser.parse(feed_url)
-        if parsed.bozo:
-            print(f"  Warning: feed parse issue — {parsed.bozo_exception}")
-        entries = parsed.entries[:limit]
-        print(f"  Got {len(entries)} entries")
-
-        for entry in entries:
-            url = entry.get("link", "").strip()
-            if not url or url in seen_urls:
-                continue
-
-            title = entry.get("title", "").strip()
-            summary = entry.get("summary", "") or ""
-
-            if not _is_tech(title, summary):
-                continue
-
-            # Price extraction: first price in title is usually deal price
-            deal_price = _extract_price(title) or _extract_price(summary)
-            original_price = _extract_original_price(title) or _extract_original_price(summary)
-
-            rows.append({
-                "title": title,
-                "url": url,
-                "price": original_price or "",
-                "deal_price": deal_price or "",
-                "currency": "$" if (deal_price or original_price) else "",
-                "image_url": _extract_image(entry),
-                "tags": tags,
-            })
-            seen_urls.add(url)
+        _collect_entries(feed_url, parsed, limit, tags, rows, seen_urls, scheduler)
+
+    _finish_fetch(rows, history, scheduler)
+    return rows
+
 
+async def _async_download(session, sem: asyncio.Semaphore, feed_url: str):
+    """Return (status, body) for a feed, or (None, b"") if the request failed."""
+    async with sem:
+        try:
+            async with session.get(feed_url, headers={"User-Agent": feedparser.USER_AGENT}) as resp:
+                return resp.status, await resp.read()
+        except Exception as e:
+            print(f"  Warning: could not download {feed_url} — {e}")
+            return None, b""
+
+
+async def async_fetch_deals(
+    feeds=None,
+    limit=50,
+    tags="tech",
+    history: PriceHistory = None,
+    scheduler: FeedScheduler = None,
+    session=None,
+    concurrency: int = FEED_CONCURRENCY,
+    sem: asyncio.Semaphore = None,
+) -> list:
+    """asyncio variant of fetch_deals: downloads up to `concurrency` feeds at once over
+    `session` (a temporary aiohttp session is created if omitted); pass `sem` to share one
+    limit across callers instead. Parsing and file I/O run in a worker thread. Rows come
+    back in the same order as fetch_deals would return them."""
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is not installed; add it to requirements.txt and install dependencies")
+    feeds = await asyncio.to_thread(_due_feeds, feeds or _build_feeds(), scheduler)
+    own_session = session is None
+    session = session or aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+    sem = sem or asyncio.Semaphore(concurrency)
+    try:
+        bodies = await asyncio.gather(*(_async_download(session, sem, f) for f in feeds))
+    finally:
+        if own_session:
+            await session.close()
+    return await asyncio.to_thread(_collect_downloads, feeds, bodies, limit, tags, history, scheduler)
+
+
+def _collect_downloads(feeds, bodies, limit, tags, history: PriceHistory = None, scheduler: FeedScheduler = None) -> list:
+    rows = []
+    seen_urls = set()
+    for feed_url, (status, body) in zip(feeds, bodies):
+        print(f"Fetched: {feed_url}")
+        if status is None or status >= 400:
+            print(f"  Warning: HTTP {status}")
+            if scheduler is not None:
+                scheduler.record_error(feed_url)
+            continue
+        _collect_entries(feed_url, feedparser.parse(body), limit, tags, rows, seen_urls, scheduler)
+
+    _finish_fetch(rows, history, scheduler)
     return rows
 
 
 def write_to_csv(rows: list, csv_path: str):
-    existing_urls = load_existing_urls(csv_path)
-    new_rows = [r for r in rows if r["url"] not in existing_urls]
+    snap = Snapshot.open(snapshot_path(csv_path))
+    try:
+        if snap is not None and snap.matches_csv(csv_path):
+            # the snapshot indexes every URL in the CSV, invalid rows included, so skip re-reading it
+            new_rows = [r for r in rows if r["url"] not in snap]
+        else:
+            existing_urls = load_existing_urls(csv_path)
+            new_rows = [r for r in rows if r["url"] not in existing_urls]
+    finally:
+        if snap is not None:
+            snap.close()
 
     if not new_rows:
         print("No new deals to add.")
@@ -170,9 +284,17 @@ def main():
     parser.add_argument("--limit", type=int, default=50, help="Max entries per feed")
     parser.add_argument("--tags", default="tech", help="Tag string to apply to all rows")
     parser.add_argument("--dry-run", action="store_true", help="Print deals without writing CSV")
+    parser.add_argument("--all-feeds", action="store_true", help="Poll every feed, ignoring per-feed schedules")
+    parser.add_argument("--profile", action="store_true", help="Write cProfile stats and collapsed stacks for the fetch")
+    parser.add_argument("--profile-memory", action="store_true", help="Write tracemalloc top allocators for the fetch")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR, help="Directory for profiling output")
     args = parser.parse_args()
+    profiler = Profiler(out_dir=args.profile_dir, cpu=args.profile, memory=args.profile_memory)
 
-    rows = fetch_deals(limit=args.limit, tags=args.tags)
+    history = None if args.dry_run else PriceHistory()
+    scheduler = None if args.dry_run or args.all_feeds else FeedScheduler()
+    with profiler.profile("fetch"):
+        rows = fetch_deals(limit=args.limit, tags=args.tags, history=history, scheduler=scheduler)
     print(f"\nTotal tech deals found: {len(rows)}")
 
     if args.dry_run:
@@ -181,7 +303,12 @@ def main():
             print(f"  {r['title'][:80]}{price_info}")
             print(f"    {r['url']}")
     else:
-        write_to_csv(rows, args.csv)
+        if write_to_csv(rows, args.csv):
+            try:
+                generation = publish_snapshot(args.csv, load_posted(POSTED_DB))
+                print(f"Published snapshot generation {generation}")
+            except Exception:
+                logger.exception("Failed to publish product snapshot")
 
 
 if __name__ == "__main__":
@@ -4,17 +4,30 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 from threading import Thread
 from datetime import datetime
 
+from snapshot import Snapshot, SNAPSHOT_FILE
+from rate_limit import RateLimiter
+
 POSTED_DB = os.getenv("POSTED_DB", "posted.json")
 LAST_RUN_FILE = os.getenv("LAST_RUN_FILE", "last_run.txt")
+RATE_LIMIT_FILE = os.getenv("RATE_LIMIT_FILE", "rate_limits.json")
+
+# mapped once and re-mapped only when a new snapshot generation is published
+_snapshot = None
 
 
 class HealthHandler(BaseHTTPRequestHandler):
     def do_GET(self):
+        global _snapshot
         if self.path.startswith("/health"):
             info = {"status": "ok", "timestamp": datetime.utcnow().isoformat() + "Z"}
-            # posted count
+            # posted count, from the shared snapshot when one has been published
+            _snapshot = _snapshot.refresh() if _snapshot is not None else Snapshot.open(SNAPSHOT_FILE)
             try:
-                if os.path.exists(POSTED_DB):
+                if _snapshot is not None:
+                    info["posted_count"] = _snapshot.posted_count
+                    info["product_count"] = len(_snapshot)
+                    info["snapshot_generation"] = _snapshot.generation
+                elif os.path.exists(POSTED_DB):
                     with open(POSTED_DB, "r", encoding="utf-8") as fh:
                         posted = json.load(fh)
                         info["posted_count"] = len(posted)
@@ -33,6 +46,20 @@ class HealthHandler(BaseHTTPRequestHandler):
             except Exception:
                 info["last_run"] = None
 
+            # remaining posting budget per endpoint
+            try:
+                limits = RateLimiter(state_file=RATE_LIMIT_FILE).snapshot()
+                info["rate_limits"] = {
+                    endpoint: {
+                        "limit": b["limit"],
+                        "remaining": b["remaining"],
+                        "reset_at": datetime.utcfromtimestamp(b["reset_at"]).isoformat() + "Z" if b["reset_at"] else None,
+                    }
+                    for endpoint, b in limits.items()
+                }
+            except Exception:
+                info["rate_limits"] = None
+
             payload = json.dumps(info).encode("utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
@@ -1,10 +1,21 @@
 from dotenv import load_dotenv
 import os
+import re
+import json
+import asyncio
 import requests
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
 
 load_dotenv()
 
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 
@@ -27,6 +38,114 @@ def _template_tweet(title: str, url: str, deal_price: Optional[float], currency:
 
 MAX_POST_CHARS = int(os.getenv("MAX_POST_CHARS", "500"))  # 500 for Threads, 280 for Twitter
 
+# Batch generation: total (prompt + completion) tokens allowed per request, and a hard cap on items
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "4000"))
+LLM_MAX_BATCH = int(os.getenv("LLM_MAX_BATCH", "10"))
+# Completion requests allowed in flight at once from async_generate_tweets
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+_NUMBER = r"(\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?)"
+_CURRENCY_SYMBOLS = r"[$€£¥]"
+_CURRENCY_WORDS = r"dollars?|bucks|usd|eur|euros?|gbp|pounds?|cad|aud|yen|jpy"
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _price_re(currency: str) -> "re.Pattern":
+    """Amounts written with a currency symbol, a currency word or code, or the product's `currency`."""
+    words = _CURRENCY_WORDS + (f"|{re.escape(currency)}" if currency else "")
+    return re.compile(
+        rf"(?:{_CURRENCY_SYMBOLS}|\b(?:{words})\b)\s*{_NUMBER}|\b{_NUMBER}(?:{_CURRENCY_SYMBOLS}|\s*(?:{words})\b)",
+        re.IGNORECASE,
+    )
+
+
+def _fields(product: object):
+    return (
+        getattr(product, "title", ""),
+        getattr(product, "url", ""),
+        getattr(product, "deal_price", None),
+        getattr(product, "price", None),
+        getattr(product, "currency", None),
+    )
+
+
+def _fallback_tweet(product: object) -> str:
+    title, url, deal_price, price, currency = _fields(product)
+    return _template_tweet(title=title, url=url, deal_price=deal_price or price, currency=currency)
+
+
+def _estimate_tokens(text: str) -> int:
+    # rough: ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def _chat_payload(system: str, user: str, max_tokens: int, json_mode: bool) -> Dict:
+    payload = {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+    }
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+def _chat_headers() -> Dict:
+    return {
+        "Authorization": f"Bearer {LLM_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def _chat(system: str, user: str, max_tokens: int, json_mode: bool = False) -> Dict:
+    """Send one chat completion and return the first choice."""
+    payload = _chat_payload(system, user, max_tokens, json_mode)
+    resp = requests.post(OPENAI_CHAT_URL, json=payload, headers=_chat_headers(), timeout=30 if json_mode else 10)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("choices", [])[0]
+
+
+async def _async_chat(session: "aiohttp.ClientSession", system: str, user: str, max_tokens: int, json_mode: bool = False) -> Dict:
+    """asyncio variant of _chat using a shared aiohttp session."""
+    payload = _chat_payload(system, user, max_tokens, json_mode)
+    timeout = aiohttp.ClientTimeout(total=30 if json_mode else 10)
+    async with session.post(OPENAI_CHAT_URL, json=payload, headers=_chat_headers(), timeout=timeout) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    return data.get("choices", [])[0]
+
+
+def _is_valid_post(text: str, product: object) -> bool:
+    """Check generated copy: within MAX_POST_CHARS, contains the URL, quotes no prices other
+    than the product's price, deal price or the difference between them, and no percentage
+    other than the actual discount (rounded)."""
+    title, url, deal_price, price, currency = _fields(product)
+    if not text or len(text) > MAX_POST_CHARS:
+        return False
+    if url and url not in text:
+        return False
+    body = text.replace(url, "") if url else text
+    known = {round(float(p), 2) for p in (price, deal_price) if p not in (None, "")}
+    discount = None
+    if len(known) == 2:
+        known.add(round(abs(float(price) - float(deal_price)), 2))
+        if float(price) > 0:
+            discount = (float(price) - float(deal_price)) / float(price) * 100
+    for match in _price_re((currency or "").strip().lower()).finditer(body):
+        raw = match.group(1) or match.group(2)
+        if round(float(raw.replace(",", "")), 2) not in known:
+            return False
+    for raw in _PERCENT_RE.findall(body):
+        if discount is None or abs(float(raw) - discount) > 1:
+            return False
+    return True
+
 
 def generate_tweet(product: object, style: Optional[str] = None) -> str:
     """Generate a short post for a product. Tries LLM provider when configured,
@@ -34,11 +153,7 @@ def generate_tweet(product: object, style: Optional[str] = None) -> str:
 
     `product` is expected to have attributes: `title`, `url`, `deal_price`, `price`, `currency`, `tags`.
     """
-    title = getattr(product, "title", "")
-    url = getattr(product, "url", "")
-    deal_price = getattr(product, "deal_price", None)
-    price = getattr(product, "price", None)
-    currency = getattr(product, "currency", None)
+    title, url, deal_price, price, currency = _fields(product)
 
     # If provider is openai and key is present, call the API
     if LLM_PROVIDER == "openai" and LLM_API_KEY:
@@ -52,26 +167,8 @@ def generate_tweet(product: object, style: Optional[str] = None) -> str:
             if style:
                 user += f"Style: {style}\n"
 
-            payload = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
-                "temperature": 0.7,
-                "max_tokens": 180,
-            }
-
-            headers = {
-                "Authorization": f"Bearer {LLM_API_KEY}",
-                "Content-Type": "application/json",
-            }
-
-            resp = requests.post("https://api.openai.com/v1/chat/completions", json=payload, headers=headers, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
             # Extract assistant content
-            text = data.get("choices", [])[0].get("message", {}).get("content", "").strip()
+            text = _chat(system, user, max_tokens=180).get("message", {}).get("content", "").strip()
             if text:
                 # Ensure URL is included; simple safeguard
                 if url and url not in text:
@@ -84,7 +181,166 @@ def generate_tweet(product: object, style: Optional[str] = None) -> str:
             pass
 
     # Fallback template
-    return _template_tweet(title=title, url=url, deal_price=deal_price or price, currency=currency)
+    return _fallback_tweet(product)
+
+
+_BATCH_SYSTEM = (
+    "You are a friendly, concise social media copywriter. For each product below write a single social"
+    f" media post (<={MAX_POST_CHARS} chars) that highlights the product title, mentions the deal price if"
+    " present, includes the product URL exactly as given, and keeps the tone enthusiastic but factual."
+    " Do not invent discounts, prices or false claims. Reply with a JSON object of the form"
+    ' {"posts": [{"id": <product id>, "text": "<post>"}]} containing one entry per product.'
+)
+
+
+def _product_block(idx: int, product: object) -> str:
+    title, url, deal_price, price, currency = _fields(product)
+    return f"id: {idx}\nProduct: {title}\nPrice: {price or 'N/A'}\nDeal price: {deal_price or 'N/A'}\nCurrency: {currency or ''}\nURL: {url}\n"
+
+
+def _plan_batches(products: List[object]) -> List[List[int]]:
+    """Group product indices so each request's estimated prompt + completion fits LLM_BATCH_TOKEN_BUDGET."""
+    per_post = _estimate_tokens("x" * MAX_POST_CHARS) + 16  # post text plus JSON wrapping
+    available = LLM_BATCH_TOKEN_BUDGET - _estimate_tokens(_BATCH_SYSTEM)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, product in enumerate(products):
+        cost = _estimate_tokens(_product_block(i, product)) + per_post
+        if current and (used + cost > available or len(current) >= LLM_MAX_BATCH):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_prompt(products: List[object], indices: List[int], style: Optional[str]):
+    user = "".join(_product_block(i, products[i]) + "\n" for i in indices)
+    if style:
+        user += f"Style: {style}\n"
+    max_tokens = len(indices) * (_estimate_tokens("x" * MAX_POST_CHARS) + 16) + 32
+    return user, max_tokens
+
+
+def _batch_posts(choice: Dict) -> List:
+    if choice.get("finish_reason") == "length":
+        raise ValueError("batch reply truncated")
+    return json.loads(choice.get("message", {}).get("content", ""))["posts"]
+
+
+def _store_posts(posts: List, products: List[object], indices: List[int], out: List[Optional[str]]):
+    wanted = set(indices)
+    for item in posts if isinstance(posts, list) else []:
+        try:
+            idx = int(item.get("id"))
+            text = str(item.get("text", "")).strip()
+        except Exception:
+            continue
+        if idx in wanted and _is_valid_post(text, products[idx]):
+            out[idx] = text
+
+
+def _generate_batch(products: List[object], indices: List[int], out: List[Optional[str]], style: Optional[str]):
+    """Fill `out` for `indices` from one completion; split the batch in half when the reply
+    is truncated or unparseable. Items that stay missing or invalid are left as None.
+
+    Transport and HTTP errors propagate: retrying smaller batches against an API that is
+    down only multiplies the timeouts.
+    """
+    user, max_tokens = _batch_prompt(products, indices, style)
+    choice = _chat(_BATCH_SYSTEM, user, max_tokens=max_tokens, json_mode=True)
+    try:
+        posts = _batch_posts(choice)
+    except (ValueError, KeyError, TypeError):
+        if len(indices) > 1:
+            mid = len(indices) // 2
+            _generate_batch(products, indices[:mid], out, style)
+            _generate_batch(products, indices[mid:], out, style)
+        return
+    _store_posts(posts, products, indices, out)
+
+
+async def _async_generate_batch(
+    session: "aiohttp.ClientSession",
+    sem: asyncio.Semaphore,
+    products: List[object],
+    indices: List[int],
+    out: List[Optional[str]],
+    style: Optional[str],
+):
+    """asyncio variant of _generate_batch; the halves of a split batch run concurrently."""
+    user, max_tokens = _batch_prompt(products, indices, style)
+    async with sem:
+        choice = await _async_chat(session, _BATCH_SYSTEM, user, max_tokens=max_tokens, json_mode=True)
+    try:
+        posts = _batch_posts(choice)
+    except (ValueError, KeyError, TypeError):
+        if len(indices) > 1:
+            mid = len(indices) // 2
+            results = await asyncio.gather(
+                _async_generate_batch(session, sem, products, indices[:mid], out, style),
+                _async_generate_batch(session, sem, products, indices[mid:], out, style),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, BaseException):
+                    raise r
+        return
+    _store_posts(posts, products, indices, out)
+
+
+def generate_tweets(products: List[object], style: Optional[str] = None) -> List[str]:
+    """Generate posts for several products with as few completion calls as the token budget allows.
+
+    Returns one post per product, in order. Items the LLM omits or gets wrong (missing URL,
+    too long, prices not taken from the product) fall back to the template.
+    """
+    products = list(products)
+    out: List[Optional[str]] = [None] * len(products)
+    if LLM_PROVIDER == "openai" and LLM_API_KEY:
+        try:
+            for indices in _plan_batches(products):
+                _generate_batch(products, indices, out, style)
+        except Exception:
+            # API unreachable or rejecting requests: template everything not yet generated
+            pass
+    return [text or _fallback_tweet(p) for text, p in zip(out, products)]
+
+
+async def async_generate_tweets(
+    products: List[object],
+    style: Optional[str] = None,
+    session: Optional["aiohttp.ClientSession"] = None,
+    concurrency: int = LLM_CONCURRENCY,
+    sem: Optional[asyncio.Semaphore] = None,
+) -> List[str]:
+    """asyncio variant of generate_tweets: batches are requested concurrently over `session`
+    (a temporary one is created if omitted), at most `concurrency` at a time. Pass `sem` to
+    share one limit across callers instead."""
+    products = list(products)
+    out: List[Optional[str]] = [None] * len(products)
+    if LLM_PROVIDER == "openai" and LLM_API_KEY and products:
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed; add it to requirements.txt and install dependencies")
+        own_session = session is None
+        session = session or aiohttp.ClientSession()
+        sem = sem or asyncio.Semaphore(concurrency)
+        try:
+            # a batch that hits a transport or HTTP error is left to the template
+            results = await asyncio.gather(
+                *(_async_generate_batch(session, sem, products, indices, out, style) for indices in _plan_batches(products)),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, BaseException) and not isinstance(r, Exception):
+                    raise r
+        finally:
+            if own_session:
+                await session.close()
+    return [text or _fallback_tweet(p) for text, p in zip(out, products)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""price_history.py — Append-only price history per canonical product.
+
+Sightings and posts are stored as fixed-width binary records in PRICE_HISTORY_FILE:
+
+    key (u64, hash of the canonical URL) | timestamp (f64, epoch) | price (f64) | kind (u8) | padding
+
+Records are only ever appended, each batch with one write on an O_APPEND descriptor
+under an exclusive lock, so writers from several processes can share the file without
+interleaving partial records. Readers keep an in-memory index per key; queries only touch that index, and
+`refresh()` picks up records appended by other processes.
+"""
+
+import os
+import time
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_FILE = os.getenv("PRICE_HISTORY_FILE", "price_history.bin")
+
+RECORD = struct.Struct("<QddB7x")
+SIGHTING = 0
+POSTED = 1
+
+# An unchanged price is re-recorded at most this often, so "lowest in N days" stays accurate
+# without one record per refresh.
+RESIGHT_SECONDS = 24 * 60 * 60
+
+_TRACKING_PARAMS = ("utm_", "ref", "tag", "affid", "aff_", "src")
+
+
+def canonical_url(url: str) -> str:
+    """Normalise a deal URL: lower-case host, no fragment, no tracking query params."""
+    p = urlparse(url.strip())
+    query = [
+        (k, v)
+        for k, v in parse_qsl(p.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    ]
+    path = p.path.rstrip("/") or "/"
+    return urlunparse((p.scheme.lower(), p.netloc.lower(), path, "", urlencode(sorted(query)), ""))
+
+
+def product_key(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(canonical_url(url).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+@dataclass
+class _Series:
+    last_ts: float = 0.0
+    last_price: Optional[float] = None
+    posted_price: Optional[float] = None
+    # Monotonic stack of (timestamp, price) with strictly increasing prices: the first entry
+    # at or after a cutoff time is the minimum over [cutoff, now], found by bisection.
+    min_ts: array = field(default_factory=lambda: array("d"))
+    min_price: array = field(default_factory=lambda: array("d"))
+
+    def add(self, ts: float, price: float, kind: int):
+        if kind == POSTED:
+            self.posted_price = price
+            return
+        self.last_ts = ts
+        self.last_price = price
+        while self.min_price and self.min_price[-1] >= price:
+            self.min_price.pop()
+            self.min_ts.pop()
+        self.min_ts.append(ts)
+        self.min_price.append(price)
+
+    def lowest_since(self, cutoff: float) -> Optional[float]:
+        i = bisect_left(self.min_ts, cutoff)
+        return self.min_price[i] if i < len(self.min_price) else None
+
+
+class PriceHistory:
+    """Price history keyed by canonical product URL.
+
+    Lookups of the latest price, the price at the last post, and the lowest price in a
+    trailing window are O(1) / O(log n) per product.
+    """
+
+    def __init__(self, path: str = PRICE_HISTORY_FILE):
+        self.path = path
+        self._series: Dict[int, _Series] = {}
+        self._offset = 0
+        # async callers refresh and append from worker threads
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def refresh(self):
+        """Index any whole records appended to the file since the last read."""
+        with self._lock:
+            try:
+                size = os.stat(self.path).st_size
+            except OSError:
+                return
+            if size - self._offset < RECORD.size:
+                return
+            with open(self.path, "rb") as fh:
+                fh.seek(self._offset)
+                data = fh.read()
+            usable = len(data) - len(data) % RECORD.size
+            for key, ts, price, kind in RECORD.iter_unpack(data[:usable]):
+                self._series.setdefault(key, _Series()).add(ts, price, kind)
+            self._offset += usable
+
+    def _append(self, records: Iterable[Tuple[int, float, float, int]]):
+        buf = b"".join(RECORD.pack(*r) for r in records)
+        if not buf:
+            return
+        with self._lock:
+            self.refresh()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                view = memoryview(buf)
+                while view:
+                    # the lock keeps other writers out if a large batch needs several writes
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            self.refresh()
+
+    def record_prices(self, prices: Iterable[Tuple[str, Optional[float]]], ts: Optional[float] = None) -> int:
+        """Record (url, price) sightings. Unchanged, recently seen prices are skipped.
+
+        Returns the number of records written.
+        """
+        ts = time.time() if ts is None else ts
+        self.refresh()
+        records = {}
+        for url, price in prices:
+            if price in (None, ""):
+                continue
+            price = float(price)
+            key = product_key(url)
+            s = self._series.get(key)
+            if s and s.last_price == price and ts - s.last_ts < RESIGHT_SECONDS:
+                continue
+            records[key] = (key, ts, price, SIGHTING)
+        self._append(records.values())
+        return len(records)
+
+    def mark_posted(self, url: str, price: Optional[float], ts: Optional[float] = None):
+        if price in (None, ""):
+            return
+        ts = time.time() if ts is None else ts
+        self._append([(product_key(url), ts, float(price), POSTED)])
+
+    def _get(self, url: str) -> Optional[_Series]:
+        return self._series.get(product_key(url))
+
+    def last_price(self, url: str) -> Optional[float]:
+        s = self._get(url)
+        return s.last_price if s else None
+
+    def lowest_since(self, url: str, days: float, now: Optional[float] = None) -> Optional[float]:
+        """Lowest price seen for the product in the last `days` days, or None."""
+        s = self._get(url)
+        if not s:
+            return None
+        now = time.time() if now is None else now
+        return s.lowest_since(now - days * 86400)
+
+    def dropped_since_post(self, url: str) -> bool:
+        """True if the product was posted before and its latest price is below the posted price."""
+        s = self._get(url)
+        return bool(s and s.posted_price is not None and s.last_price is not None and s.last_price < s.posted_price)
+
+    def price_drop(self, url: str, days: float, now: Optional[float] = None) -> Optional[float]:
+        """Latest price if it is below the posted price and the lowest in `days` days, else None."""
+        s = self._get(url)
+        if not s or s.posted_price is None or s.last_price is None or s.last_price >= s.posted_price:
+            return None
+        now = time.time() if now is None else now
+        lowest = s.lowest_since(now - days * 86400)
+        return s.last_price if lowest is not None and s.last_price <= lowest else None
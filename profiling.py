@@ -0,0 +1,182 @@
+"""profiling.py — Opt-in per-run CPU and memory profiling.
+
+Each profiled run writes, into PROFILE_DIR:
+
+    <stamp>-<label>.prof       cProfile stats (load with pstats or snakeviz)
+    <stamp>-<label>.collapsed  collapsed stacks ("a;b;c <microseconds>") for flamegraph.pl / speedscope
+    <stamp>-<label>.mem.txt    tracemalloc top allocators (memory profiling only)
+
+Only the newest PROFILE_KEEP runs are kept. A long-running service can be switched
+into profiling without a restart by creating PROFILE_TRIGGER_FILE; its optional contents
+are whitespace-separated words: "memory" adds allocation tracking and a number between
+0 and 1 sets the fraction of runs sampled (e.g. "memory 0.1").
+"""
+
+import os
+import random
+import cProfile
+import pstats
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_TRIGGER_FILE = os.getenv("PROFILE_TRIGGER_FILE", "profile.on")
+PROFILE_TOP_ALLOCATIONS = 25
+# Stacks are not expanded below this much time, which bounds the walk on large call graphs
+MIN_STACK_SECONDS = 1e-4
+
+_SUFFIXES = (".prof", ".collapsed", ".mem.txt")
+
+
+def _func_name(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, int]:
+    """Approximate collapsed stacks from cProfile's caller/callee graph.
+
+    cProfile only records one level of callers, so each function's time is split
+    between its callers in proportion to the time spent on each call edge.
+    Returns {"root;...;leaf": microseconds of self time}.
+    """
+    raw = stats.stats
+    children: Dict[tuple, Dict[tuple, float]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, {})[func] = edge[3]
+
+    out: Dict[str, int] = {}
+
+    def walk(func, budget: float, path: Tuple[str, ...], on_stack: frozenset):
+        _, _, tt, ct, _ = raw[func]
+        if budget < MIN_STACK_SECONDS or ct <= 0:
+            return
+        path = path + (_func_name(func),)
+        share = budget / ct
+        self_us = int(tt * share * 1e6)
+        if self_us:
+            key = ";".join(path)
+            out[key] = out.get(key, 0) + self_us
+        for child, edge_ct in children.get(func, {}).items():
+            if child not in on_stack and child in raw:
+                walk(child, edge_ct * share, path, on_stack | {child})
+
+    for func, (_, _, _, ct, callers) in raw.items():
+        if not callers:
+            walk(func, ct, (), frozenset([func]))
+    return out
+
+
+class Profiler:
+    """Wrap runs in cProfile and/or tracemalloc and write the results to `out_dir`.
+
+    `cpu` / `memory` enable profiling for every run (the --profile / --profile-memory
+    flags). Otherwise runs are profiled only while `trigger_file` exists. Either way,
+    only a `sample_rate` fraction of runs is profiled.
+    """
+
+    def __init__(
+        self,
+        out_dir: str = PROFILE_DIR,
+        cpu: bool = False,
+        memory: bool = False,
+        sample_rate: float = 1.0,
+        keep: int = PROFILE_KEEP,
+        trigger_file: Optional[str] = PROFILE_TRIGGER_FILE,
+    ):
+        self.out_dir = out_dir
+        self.cpu = cpu
+        self.memory = memory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.trigger_file = trigger_file
+
+    def _settings(self) -> Tuple[bool, bool, float]:
+        """Return (cpu, memory, sample_rate) for the next run."""
+        if self.cpu or self.memory:
+            return self.cpu, self.memory, self.sample_rate
+        if not self.trigger_file or not os.path.exists(self.trigger_file):
+            return False, False, 0.0
+        memory, rate = False, self.sample_rate
+        try:
+            with open(self.trigger_file, "r", encoding="utf-8") as fh:
+                for word in fh.read().split():
+                    if word.lower() == "memory":
+                        memory = True
+                    else:
+                        rate = float(word)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable profiling trigger %s", self.trigger_file)
+        return True, memory, rate
+
+    @contextmanager
+    def profile(self, label: str) -> Iterator[None]:
+        """Profile the body of the `with` block if profiling is enabled for this run."""
+        cpu, memory, rate = self._settings()
+        if not (cpu or memory) or random.random() >= rate:
+            yield
+            return
+
+        prof = cProfile.Profile() if cpu else None
+        started_tracing = memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if prof:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof:
+                prof.disable()
+            mem_snapshot = tracemalloc.take_snapshot() if memory else None
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                self._write(label, prof, mem_snapshot)
+            except Exception:
+                logger.exception("Failed to write profile for %s", label)
+
+    def _write(self, label: str, prof: Optional[cProfile.Profile], mem_snapshot):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        base = os.path.join(self.out_dir, f"{stamp}-{label}")
+
+        if prof is not None:
+            prof.dump_stats(base + ".prof")
+            stacks = collapsed_stacks(pstats.Stats(prof))
+            with open(base + ".collapsed", "w", encoding="utf-8") as fh:
+                for stack, us in sorted(stacks.items()):
+                    fh.write(f"{stack} {us}\n")
+
+        if mem_snapshot is not None:
+            stats = mem_snapshot.statistics("lineno")
+            total = sum(s.size for s in stats)
+            with open(base + ".mem.txt", "w", encoding="utf-8") as fh:
+                fh.write(f"Total traced: {total / 1024:.1f} KiB in {sum(s.count for s in stats)} blocks\n")
+                for s in stats[:PROFILE_TOP_ALLOCATIONS]:
+                    fh.write(f"{s}\n")
+
+        logger.info("Wrote profile %s", base)
+        self._rotate()
+
+    def _rotate(self):
+        """Delete all files of runs older than the newest `keep`."""
+        runs = set()
+        for name in os.listdir(self.out_dir):
+            for suffix in _SUFFIXES:
+                if name.endswith(suffix):
+                    runs.add(name[: -len(suffix)])
+        for run in sorted(runs)[: max(0, len(runs) - self.keep)]:
+            for suffix in _SUFFIXES:
+                path = os.path.join(self.out_dir, run + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,173 @@
+"""rate_limit.py — Per-endpoint posting budgets driven by x-rate-limit-* headers."""
+
+import json
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_FILE = os.getenv("RATE_LIMIT_FILE", "rate_limits.json")
+
+# Used when a 429 arrives without an x-rate-limit-reset header (15 min = Twitter's standard window)
+DEFAULT_WINDOW_SECONDS = 15 * 60
+
+
+class RateLimitExceeded(Exception):
+    """Raised instead of sleeping when an endpoint has no budget left.
+
+    `retry_at` is the epoch time at which the next request is expected to succeed.
+    """
+
+    def __init__(self, endpoint: str, retry_at: float):
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+        when = datetime.fromtimestamp(retry_at, timezone.utc).isoformat()
+        super().__init__(f"Rate limit exhausted for {endpoint}; next slot at {when}")
+
+
+@dataclass
+class Bucket:
+    """Request budget for one endpoint, refilled to `limit` at `reset_at`."""
+
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    reset_at: float = 0.0
+
+    def refill(self, now: float) -> bool:
+        """Restore the full budget once the window has reset. Returns True if it did."""
+        if self.reset_at and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = 0.0
+            return True
+        return False
+
+
+def _header(headers: Mapping, name: str) -> Optional[int]:
+    for key, val in (headers or {}).items():
+        if key.lower() == name:
+            try:
+                return int(val)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class RateLimiter:
+    """Token bucket per endpoint, kept in sync with the API's rate-limit headers.
+
+    Never sleeps: callers ask `try_acquire` before a request and `next_available`
+    when they need to know when to come back. State is persisted to `state_file`
+    so the budget survives restarts and can be read by the health server.
+    """
+
+    def __init__(self, state_file: Optional[str] = RATE_LIMIT_FILE):
+        self.state_file = state_file
+        self._buckets: Dict[str, Bucket] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            for endpoint, raw in data.items():
+                self._buckets[endpoint] = Bucket(
+                    limit=raw.get("limit"),
+                    remaining=raw.get("remaining"),
+                    reset_at=float(raw.get("reset_at") or 0.0),
+                )
+        except Exception:
+            logger.warning("Ignoring unreadable rate limit state in %s", self.state_file)
+
+    def _save(self):
+        if not self.state_file:
+            return
+        # write-then-rename so readers such as the health server never see a partial file
+        tmp = f"{self.state_file}.tmp{os.getpid()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({k: asdict(b) for k, b in self._buckets.items()}, fh, indent=2)
+            os.replace(tmp, self.state_file)
+        except Exception:
+            logger.exception("Failed to write rate limit state")
+
+    def update_from_headers(self, endpoint: str, headers: Mapping):
+        """Record the budget reported by a response's x-rate-limit-* headers."""
+        limit = _header(headers, "x-rate-limit-limit")
+        remaining = _header(headers, "x-rate-limit-remaining")
+        reset = _header(headers, "x-rate-limit-reset")
+        if limit is None and remaining is None and reset is None:
+            return
+        with self._lock:
+            bucket = self._buckets.setdefault(endpoint, Bucket())
+            if limit is not None:
+                bucket.limit = limit
+            if remaining is not None:
+                bucket.remaining = remaining
+            if reset is not None:
+                bucket.reset_at = float(reset)
+            self._save()
+
+    def mark_exhausted(self, endpoint: str, headers: Optional[Mapping] = None, now: Optional[float] = None) -> float:
+        """Record a 429 for `endpoint`. Returns the epoch time of the next slot."""
+        now = time.time() if now is None else now
+        reset = _header(headers, "x-rate-limit-reset")
+        limit = _header(headers, "x-rate-limit-limit")
+        with self._lock:
+            bucket = self._buckets.setdefault(endpoint, Bucket())
+            if limit is not None:
+                bucket.limit = limit
+            bucket.remaining = 0
+            bucket.reset_at = float(reset) if reset else now + DEFAULT_WINDOW_SECONDS
+            self._save()
+            return bucket.reset_at
+
+    def try_acquire(self, endpoint: str, now: Optional[float] = None) -> bool:
+        """Take one token for `endpoint`. Returns False (without waiting) if none are left."""
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                return True
+            if bucket.refill(now):
+                self._save()
+            if bucket.remaining is None:
+                return True
+            if bucket.remaining <= 0:
+                return False
+            bucket.remaining -= 1
+            return True
+
+    def next_available(self, endpoint: str, now: Optional[float] = None) -> float:
+        """Epoch time at which `endpoint` can next be called (`now` if it has budget)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                return now
+            if bucket.refill(now):
+                self._save()
+            if bucket.remaining is None or bucket.remaining > 0:
+                return now
+            return bucket.reset_at or now
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Dict]:
+        """Return the current budget per endpoint, suitable for JSON output.
+
+        Windows that have already reset are reported as refilled (without writing the state file).
+        """
+        now = time.time() if now is None else now
+        out = {}
+        with self._lock:
+            for endpoint, bucket in self._buckets.items():
+                current = Bucket(**asdict(bucket))
+                current.refill(now)
+                out[endpoint] = asdict(current)
+        return out
@@ -0,0 +1,360 @@
+"""snapshot.py — Compact binary snapshot of products and posted flags shared between processes.
+
+The fetcher (and the bot, after a run that posted) publishes the snapshot by writing a
+temporary file and atomically renaming it over the snapshot path, under a lock file so
+concurrent writers get distinct generations. Readers memory-map the current file
+read-only and re-map only when the generation at the path changes, so lookups need
+no parsing. The CSV's path, mtime and size recorded at publish time tell readers
+whether the snapshot still reflects that CSV.
+
+Layout (little-endian):
+
+    header   magic, version, generation, product count, record count, posted count,
+             CSV mtime and size, CSV path ref, index slots, section offsets
+    records  one fixed-width record per URL in the CSV: url hash, flags, prices, string refs.
+             Products come first; rows that failed validation follow, flagged invalid,
+             so their URLs are still known to be in the CSV.
+    index    open-addressing hash table of (url hash, record number + 1)
+    strings  UTF-8 blob referenced by (offset, length) pairs in the records and header
+"""
+
+import os
+import csv
+import json
+import mmap
+import math
+import struct
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from utils import Product, parse_row
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", "products.snapshot")
+PRODUCTS_CSV = os.getenv("PRODUCTS_CSV", "products.csv")
+
+MAGIC = b"DBSN"
+VERSION = 2
+HEADER = struct.Struct("<4sIQIIIqQIIIQQQ")
+RECORD = struct.Struct("<QB7xdd10I")
+SLOT = struct.Struct("<QI")
+
+FLAG_POSTED = 1
+FLAG_INVALID = 2
+_STRING_FIELDS = ("title", "url", "currency", "image_url", "tags")
+
+
+def url_hash(url: str) -> int:
+    # 0 marks an empty index slot, so never hand it out
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def _price(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def snapshot_path(csv_path: str) -> str:
+    """Snapshot file for `csv_path`: SNAPSHOT_FILE for the default products CSV, otherwise
+    a `.snapshot` file beside the CSV, so bots on different CSVs never share one."""
+    if os.path.abspath(csv_path) == os.path.abspath(PRODUCTS_CSV):
+        return SNAPSHOT_FILE
+    return os.path.splitext(csv_path)[0] + ".snapshot"
+
+
+CsvStamp = Tuple[str, int, int]
+
+
+def csv_stamp(csv_path: str) -> Optional[CsvStamp]:
+    """(real path, mtime in ns, size) of `csv_path`, or None if it does not exist."""
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return None
+    return os.path.realpath(csv_path), st.st_mtime_ns, st.st_size
+
+
+@contextmanager
+def _publish_lock(path: str):
+    """Serialise publishers (bot, fetch_deals cron) so each gets its own generation."""
+    with open(path + ".lock", "a+b") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_header(path: str):
+    """Return the unpacked header of the snapshot at `path`, or None if there is no usable one."""
+    try:
+        with open(path, "rb") as fh:
+            header = HEADER.unpack(fh.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return header if header[0] == MAGIC and header[1] == VERSION else None
+
+
+def write_snapshot(
+    products: List[Product],
+    posted: Dict,
+    path: str = SNAPSHOT_FILE,
+    stamp: Optional[CsvStamp] = None,
+    invalid_urls: Iterable[str] = (),
+) -> int:
+    """Atomically publish a snapshot of `products` with posted flags from `posted`.
+
+    `stamp` identifies the CSV the products were read from (see `csv_stamp`), and
+    `invalid_urls` are the URLs of its rows that failed validation. Returns the
+    generation written (one more than the snapshot it replaces).
+    """
+    # the CSV may contain the same URL twice; keep the first, like read_products order
+    by_hash = {}
+    for p in products:
+        by_hash.setdefault(url_hash(p.url), p)
+    count = len(by_hash)
+    for url in invalid_urls:
+        by_hash.setdefault(url_hash(url), url)
+    items = list(by_hash.items())
+
+    strings = bytearray()
+    records = bytearray()
+    for h, p in items:
+        if isinstance(p, str):
+            p, flags = Product(title="", url=p), FLAG_INVALID
+        else:
+            flags = FLAG_POSTED if p.url in posted else 0
+        refs = []
+        for name in _STRING_FIELDS:
+            value = getattr(p, name)
+            if name == "tags":
+                value = ",".join(value or [])
+            raw = (value or "").encode("utf-8")
+            refs += [len(strings), len(raw)]
+            strings += raw
+        records += RECORD.pack(h, flags, _price(p.price), _price(p.deal_price), *refs)
+    csv_path, csv_mtime, csv_size = stamp or ("", 0, 0)
+    csv_ref = (len(strings), len(csv_path.encode("utf-8")))
+    strings += csv_path.encode("utf-8")
+
+    nslots = 1
+    while nslots < 2 * len(items):
+        nslots *= 2
+    slots = [(0, 0)] * nslots
+    for i, (h, _) in enumerate(items):
+        j = h & (nslots - 1)
+        while slots[j][0]:
+            j = (j + 1) & (nslots - 1)
+        slots[j] = (h, i + 1)
+    index = b"".join(SLOT.pack(h, i) for h, i in slots)
+
+    records_off = HEADER.size
+    index_off = records_off + len(records)
+    strings_off = index_off + len(index)
+
+    with _publish_lock(path):
+        current = _read_header(path)
+        generation = current[2] + 1 if current else 1
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            generation,
+            count,
+            len(items),
+            len(posted),
+            csv_mtime,
+            csv_size,
+            *csv_ref,
+            nslots,
+            records_off,
+            index_off,
+            strings_off,
+        )
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as fh:
+            fh.write(header)
+            fh.write(records)
+            fh.write(index)
+            fh.write(strings)
+            fh.flush()
+            os.fsync(fh.fileno())
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # e.g. Windows refuses to replace a file another process has mapped
+            logger.warning("Could not publish snapshot to %s; readers keep the previous generation", path)
+            os.remove(tmp)
+            return generation - 1
+    return generation
+
+
+def load_posted(posted_path: str) -> Dict:
+    """Read the posted-URL JSON database, treating a missing or unreadable file as empty."""
+    if not os.path.exists(posted_path):
+        return {}
+    try:
+        with open(posted_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        logger.warning("Ignoring unreadable %s while building snapshot", posted_path)
+        return {}
+
+
+def publish_snapshot(csv_path: str, posted: Dict, path: Optional[str] = None) -> int:
+    """Parse the products CSV once and publish it with posted flags from `posted`.
+
+    `path` defaults to `snapshot_path(csv_path)`.
+    """
+    path = path or snapshot_path(csv_path)
+    # stamp first: edits made while parsing make the snapshot look stale, never current
+    stamp = csv_stamp(csv_path)
+    if stamp is None:
+        return write_snapshot([], posted, path)
+    products, invalid_urls = [], []
+    with open(csv_path, newline="", encoding="utf-8-sig") as fh:
+        for i, row in enumerate(csv.DictReader(fh), start=1):
+            product, _ = parse_row(row, i)
+            if product is not None:
+                products.append(product)
+            elif row.get("url"):
+                invalid_urls.append(row["url"])
+    return write_snapshot(products, posted, path, stamp, invalid_urls)
+
+
+def republish(snap: "Snapshot", posted: Dict) -> int:
+    """Publish `snap`'s products again with posted flags from `posted`, without reading the CSV."""
+    return write_snapshot(list(snap.products()), posted, snap.path, snap.csv_stamp, snap.invalid_urls())
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a published snapshot."""
+
+    def __init__(self, path: str = SNAPSHOT_FILE):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self.generation,
+            self.count,
+            self._nrecords,
+            self.posted_count,
+            csv_mtime,
+            csv_size,
+            csv_path_off,
+            csv_path_len,
+            self._nslots,
+            self._records_off,
+            self._index_off,
+            self._strings_off,
+        ) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} product snapshot")
+        start = self._strings_off + csv_path_off
+        csv_path = self._mm[start:start + csv_path_len].decode("utf-8")
+        self.csv_stamp: Optional[CsvStamp] = (csv_path, csv_mtime, csv_size) if csv_path else None
+
+    @classmethod
+    def open(cls, path: str = SNAPSHOT_FILE) -> Optional["Snapshot"]:
+        """Map the snapshot at `path`, or return None if there is no usable one."""
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def close(self):
+        self._mm.close()
+
+    def is_stale(self) -> bool:
+        """True when a snapshot with a different generation has been published at `path`."""
+        header = _read_header(self.path)
+        return header is not None and header[2] != self.generation
+
+    def matches_csv(self, csv_path: str) -> bool:
+        """True if this snapshot was built from `csv_path` and the file is unchanged since."""
+        return self.csv_stamp is not None and csv_stamp(csv_path) == self.csv_stamp
+
+    def refresh(self) -> "Snapshot":
+        """Return a mapping of the latest snapshot, closing this one if it was replaced."""
+        if not self.is_stale():
+            return self
+        latest = Snapshot.open(self.path)
+        if latest is None:
+            return self
+        self.close()
+        return latest
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _find(self, url: str) -> Optional[int]:
+        h = url_hash(url)
+        mask = self._nslots - 1
+        j = h & mask
+        while True:
+            slot_hash, idx = SLOT.unpack_from(self._mm, self._index_off + j * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == h:
+                return idx - 1
+            j = (j + 1) & mask
+
+    def _record(self, i: int):
+        return RECORD.unpack_from(self._mm, self._records_off + i * RECORD.size)
+
+    def _product(self, rec) -> Product:
+        _, _, price, deal_price, *refs = rec
+        values = {}
+        for n, name in enumerate(_STRING_FIELDS):
+            start = self._strings_off + refs[2 * n]
+            values[name] = self._mm[start:start + refs[2 * n + 1]].decode("utf-8")
+        return Product(
+            title=values["title"],
+            url=values["url"],
+            price=None if math.isnan(price) else price,
+            deal_price=None if math.isnan(deal_price) else deal_price,
+            currency=values["currency"] or None,
+            image_url=values["image_url"] or None,
+            tags=values["tags"].split(",") if values["tags"] else None,
+        )
+
+    def __contains__(self, url: str) -> bool:
+        """True if `url` appears in the CSV, including rows that failed validation."""
+        return self._find(url) is not None
+
+    def get(self, url: str) -> Optional[Product]:
+        i = self._find(url)
+        return None if i is None or i >= self.count else self._product(self._record(i))
+
+    def is_posted(self, url: str) -> bool:
+        i = self._find(url)
+        return i is not None and bool(self._record(i)[1] & FLAG_POSTED)
+
+    def products(self) -> Iterator[Product]:
+        for i in range(self.count):
+            yield self._product(self._record(i))
+
+    def invalid_urls(self) -> Iterator[str]:
+        for i in range(self.count, self._nrecords):
+            yield self._product(self._record(i)).url
@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+import json
+import pytest
+from aiohttp import web
+import bot
+import llm
+import threads_client
+from feed_scheduler import FeedScheduler
+from fetch_deals import async_fetch_deals
+from utils import Product
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.posts = []
+
+    async def post_tweet(self, text):
+        self.posts.append(text)
+        return {"id": str(len(self.posts))}
+
+
+def test_async_run_once_posts_up_to_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / "products.csv"
+    csv_path.write_text("title,url,deal_price\nA,https://example.com/a,1\nB,https://example.com/b,2\nC,https://example.com/c,3\n")
+
+    async def fake_fetch(**kwargs):
+        return []
+
+    monkeypatch.setattr(bot, "async_fetch_deals", fake_fetch)
+    monkeypatch.setattr(llm, "LLM_API_KEY", None)
+
+    client = FakeAsyncClient()
+    b = bot.Bot(str(csv_path), client)
+    asyncio.run(b.async_run_once(limit=2))
+
+    assert len(client.posts) == 2
+    assert set(b.posted) == {"https://example.com/a", "https://example.com/b"}
+    assert [p.url for p in b.select_products()] == ["https://example.com/c"]
+
+
+@contextlib.asynccontextmanager
+async def serve(routes):
+    """Run an aiohttp app with `routes` on a free local port; yields its base URL."""
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def test_async_threads_client_retries_and_sync_bot_rejects_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(threads_client, "POST_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(threads_client, "PUBLISH_DELAY_SECONDS", 0)
+    calls = []
+
+    async def create(request):
+        calls.append(request.query["text"])
+        if len(calls) == 1:
+            return web.Response(status=500)
+        return web.json_response({"id": "container"})
+
+    async def publish(request):
+        assert request.query["creation_id"] == "container"
+        return web.json_response({"id": "post-1"})
+
+    async def go():
+        async with serve([web.post("/u1/threads", create), web.post("/u1/threads_publish", publish)]) as base:
+            monkeypatch.setattr(threads_client, "THREADS_API_BASE", base)
+            client = threads_client.AsyncThreadsClient(user_id="u1", access_token="token")
+            try:
+                return await client.post_tweet("hello")
+            finally:
+                await client.close()
+
+    assert asyncio.run(go()) == {"id": "post-1"}
+    assert calls == ["hello", "hello"]
+
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / "products.csv"
+    csv_path.write_text("title,url\nA,https://example.com/a\n")
+    b = bot.Bot(str(csv_path), threads_client.AsyncThreadsClient(user_id="u1", access_token="token"))
+    with pytest.raises(TypeError):
+        b.post_product(b.select_products()[0])
+    assert b.posted == {}
+
+
+def test_async_fetch_deals_records_http_errors(tmp_path):
+    rss = (
+        '<?xml version="1.0"?><rss version="2.0"><channel><title>deals</title>'
+        "<item><title>Gaming laptop $799</title><link>https://example.com/laptop</link></item>"
+        "</channel></rss>"
+    )
+
+    async def feed(request):
+        return web.Response(text=rss, content_type="application/rss+xml")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    scheduler = FeedScheduler(state_file=str(tmp_path / "feed_state.json"))
+
+    async def go():
+        async with serve([web.get("/feed", feed), web.get("/missing", missing)]) as base:
+            feeds = [f"{base}/feed", f"{base}/missing"]
+            rows = await async_fetch_deals(feeds=feeds, scheduler=scheduler, sem=asyncio.Semaphore(1))
+            return feeds, rows
+
+    feeds, rows = asyncio.run(go())
+    assert [r["url"] for r in rows] == ["https://example.com/laptop"]
+    assert scheduler.feeds[feeds[0]].errors == 0
+    assert scheduler.feeds[feeds[1]].errors == 1
+
+
+def test_async_generate_tweets_splits_truncated_batches(monkeypatch):
+    products = [Product(title=f"Item {i}", url=f"https://example.com/{i}") for i in range(2)]
+    batch_sizes = []
+
+    async def chat(request):
+        body = await request.json()
+        ids = [int(line[4:]) for line in body["messages"][1]["content"].splitlines() if line.startswith("id: ")]
+        batch_sizes.append(len(ids))
+        if len(ids) > 1:
+            return web.json_response({"choices": [{"finish_reason": "length", "message": {"content": '{"posts": ['}}]})
+        posts = [{"id": i, "text": f"Item {i} is here https://example.com/{i}"} for i in ids]
+        message = {"content": json.dumps({"posts": posts})}
+        return web.json_response({"choices": [{"finish_reason": "stop", "message": message}]})
+
+    monkeypatch.setattr(llm, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(llm, "LLM_API_KEY", "test")
+
+    async def go():
+        async with serve([web.post("/chat", chat)]) as base:
+            monkeypatch.setattr(llm, "OPENAI_CHAT_URL", f"{base}/chat")
+            return await llm.async_generate_tweets(products, sem=asyncio.Semaphore(1))
+
+    assert asyncio.run(go()) == [f"Item {i} is here https://example.com/{i}" for i in range(2)]
+    assert sorted(batch_sizes) == [1, 1, 2]
+
+
+def test_bots_sharing_limits_never_exceed_them(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot, "async_fetch_deals", lambda **kwargs: asyncio.sleep(0, []))
+    monkeypatch.setattr(llm, "LLM_API_KEY", None)
+    in_flight = []
+
+    class SlowClient:
+        async def post_tweet(self, text):
+            in_flight.append(text)
+            assert len(in_flight) == 1
+            await asyncio.sleep(0.01)
+            in_flight.remove(text)
+            return {"id": text}
+
+    bots = []
+    for name in ("one", "two"):
+        csv_path = tmp_path / f"{name}.csv"
+        csv_path.write_text(f"title,url\nA,https://example.com/{name}/a\nB,https://example.com/{name}/b\n")
+        bots.append(bot.Bot(str(csv_path), SlowClient()))
+
+    async def go():
+        limits = bot.AsyncLimits(posts=asyncio.Semaphore(1))
+        await asyncio.gather(*(b.async_run_once(limit=2, limits=limits) for b in bots))
+
+    asyncio.run(go())
+    assert all(len(b.posted) == 2 for b in bots)
@@ -0,0 +1,37 @@
+import os
+from feed_scheduler import FeedScheduler
+
+
+def test_quiet_feeds_slow_down_and_failures_back_off():
+    s = FeedScheduler(state_file=None, min_interval=600, max_interval=6000, target_new=3)
+    busy, quiet = "https://feeds/busy", "https://feeds/quiet"
+    assert s.due([busy, quiet], now=0) == [busy, quiet]
+
+    s.record_success(busy, ["https://d/1"], now=0)
+    s.record_success(quiet, ["https://d/q"], now=0)
+    # busy feed turns over 6 entries in 10 minutes, quiet one repeats itself
+    assert s.record_success(busy, [f"https://d/{i}" for i in range(2, 8)], now=600) == 6
+    assert s.record_success(quiet, ["https://d/q"], now=600) == 0
+    assert s.feeds[busy].interval == 600
+    assert s.feeds[quiet].interval == 1200
+    assert s.due([busy, quiet], now=1200) == [busy]
+
+    s.record_error(busy, now=1200)
+    s.record_error(busy, now=1200)
+    assert s.feeds[busy].next_poll_at == 1200 + 2400
+
+
+def test_processes_sharing_state_keep_each_others_updates(tmp_path):
+    path = str(tmp_path / "feed_state.json")
+    bot_side = FeedScheduler(state_file=path, min_interval=600, max_interval=6000)
+    cron_side = FeedScheduler(state_file=path, min_interval=600, max_interval=6000)
+
+    bot_side.record_success("https://feeds/a", ["https://d/1"], now=0)
+    bot_side.save()
+    cron_side.record_error("https://feeds/b", now=0)
+    cron_side.save()
+
+    assert set(FeedScheduler(state_file=path).feeds) == {"https://feeds/a", "https://feeds/b"}
+    # the bot sees the cron's backoff before deciding what to poll
+    assert bot_side.due(["https://feeds/a", "https://feeds/b"], now=700) == ["https://feeds/a"]
+    assert not [n for n in os.listdir(tmp_path) if ".tmp" in n]
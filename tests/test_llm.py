@@ -0,0 +1,55 @@
+import json
+import llm
+from utils import Product
+
+
+def test_generate_tweets_batches_and_falls_back(monkeypatch):
+    products = [
+        Product(title="Good Laptop", url="https://example.com/a", price=999.0, deal_price=799.0, currency="$"),
+        Product(title="Bad Price Mouse", url="https://example.com/b", deal_price=19.99, currency="$"),
+        Product(title="Missing Monitor", url="https://example.com/c"),
+    ]
+    calls = []
+
+    def fake_chat(system, user, max_tokens, json_mode=False):
+        calls.append(user)
+        posts = [
+            {"id": 0, "text": "Good Laptop now $799, save $200! https://example.com/a"},
+            {"id": 1, "text": "Mouse for only $9.99 https://example.com/b"},
+        ]
+        return {"finish_reason": "stop", "message": {"content": json.dumps({"posts": posts})}}
+
+    monkeypatch.setattr(llm, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(llm, "LLM_API_KEY", "test")
+    monkeypatch.setattr(llm, "_chat", fake_chat)
+
+    out = llm.generate_tweets(products)
+    assert len(calls) == 1
+    assert out[0] == "Good Laptop now $799, save $200! https://example.com/a"
+    assert out[1] == llm._fallback_tweet(products[1])
+    assert out[2] == llm._fallback_tweet(products[2])
+
+
+def test_api_errors_do_not_split_batches(monkeypatch):
+    products = [Product(title=f"Item {i}", url=f"https://example.com/{i}") for i in range(10)]
+    calls = []
+
+    def failing_chat(system, user, max_tokens, json_mode=False):
+        calls.append(user)
+        raise llm.requests.ConnectionError("api down")
+
+    monkeypatch.setattr(llm, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(llm, "LLM_API_KEY", "test")
+    monkeypatch.setattr(llm, "_chat", failing_chat)
+
+    assert llm.generate_tweets(products) == [llm._fallback_tweet(p) for p in products]
+    assert len(calls) == 1
+
+
+def test_invented_prices_and_discounts_are_rejected():
+    p = Product(title="Monitor", url="https://example.com/m", price=500.0, deal_price=400.0, currency="USD")
+    assert llm._is_valid_post("Monitor for 400 dollars, 20% off! https://example.com/m", p)
+    assert llm._is_valid_post("Monitor down to USD 400 https://example.com/m", p)
+    assert not llm._is_valid_post("Monitor, was 600 dollars https://example.com/m", p)
+    assert not llm._is_valid_post("Monitor 90% off https://example.com/m", p)
+    assert not llm._is_valid_post("Mouse 50% off https://example.com/m", Product(title="Mouse", url="https://example.com/m"))
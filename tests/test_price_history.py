@@ -0,0 +1,84 @@
+import os
+import tempfile
+from price_history import PriceHistory, canonical_url
+
+
+def test_lowest_since_and_drop_since_post():
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    try:
+        url = "https://example.com/deal/1?utm_source=rss"
+        h = PriceHistory(path)
+        day = 86400
+        h.record_prices([(url, 50.0)], ts=0)
+        h.record_prices([(url, 40.0)], ts=5 * day)
+        h.mark_posted(url, 40.0, ts=5 * day)
+        h.record_prices([(url, 45.0)], ts=10 * day)
+        assert h.lowest_since(url, 3, now=10 * day) == 45.0
+        assert h.lowest_since(url, 7, now=10 * day) == 40.0
+        assert not h.dropped_since_post(url)
+
+        # another process appends to the same file; this reader picks it up
+        PriceHistory(path).record_prices([("https://EXAMPLE.com/deal/1/", 35.0)], ts=11 * day)
+        assert h.last_price(url) == 45.0  # queries never touch the file
+        h.refresh()
+        assert h.last_price(url) == 35.0
+        assert h.dropped_since_post(url)
+        assert h.lowest_since(url, 30, now=11 * day) == 35.0
+        assert h.price_drop(url, 30, now=11 * day) == 35.0
+    finally:
+        os.remove(path)
+
+
+def test_canonical_url_drops_tracking_params():
+    assert canonical_url("https://Example.com/p/?utm_medium=x&id=3#top") == "https://example.com/p?id=3"
+
+
+def test_repost_after_price_drop_uses_fresh_copy(tmp_path, monkeypatch):
+    import bot
+
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / "products.csv"
+    url = "https://example.com/deal/1"
+    csv_path.write_text(f"title,url,deal_price\nLaptop,{url},50\n")
+    posts = []
+
+    class Client:
+        def post_tweet(self, text):
+            posts.append(text)
+            return {"id": str(len(posts))}
+
+    monkeypatch.setattr(bot, "fetch_deals", lambda **kwargs: [])
+    monkeypatch.setattr(bot, "generate_tweets", lambda products: [f"{p.url} ${p.deal_price}" for p in products])
+
+    b = bot.Bot(str(csv_path), Client())
+    b.history.record_prices([(url, 50.0)])
+    b.run_once(limit=1)
+    assert posts == [f"{url} $50.0"]
+    assert b.select_products() == []
+
+    # a stale draft for the old price must not be reused
+    b.drafts[(url, 50.0)] = f"{url} $50.0"
+    b.history.record_prices([(url, 40.0)])
+    b.run_once(limit=1)
+    assert posts[-1] == f"{url} $40.0"
+
+
+def test_concurrent_writers_keep_records_aligned(tmp_path):
+    import threading
+    from price_history import RECORD
+
+    path = str(tmp_path / "history.bin")
+
+    def writer(n):
+        h = PriceHistory(path)
+        for i in range(50):
+            h.record_prices([(f"https://example.com/{n}/{j}", float(i)) for j in range(20)], ts=i)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert os.path.getsize(path) == 4 * 50 * 20 * RECORD.size
+    assert PriceHistory(path).last_price("https://example.com/3/19") == 49.0
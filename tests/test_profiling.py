@@ -0,0 +1,28 @@
+import os
+from profiling import Profiler
+
+
+def _work():
+    return sum(i * i for i in range(20000))
+
+
+def test_trigger_file_enables_profiling_and_output_rotates(tmp_path):
+    out = tmp_path / "profiles"
+    trigger = tmp_path / "profile.on"
+    profiler = Profiler(out_dir=str(out), keep=2, trigger_file=str(trigger))
+
+    with profiler.profile("run_once"):
+        _work()
+    assert not out.exists()
+
+    trigger.write_text("memory")
+    for _ in range(3):
+        with profiler.profile("run_once"):
+            _work()
+
+    names = sorted(os.listdir(out))
+    assert len(names) == 6
+    assert {n.split("-", 1)[1] for n in names} == {"run_once.prof", "run_once.collapsed", "run_once.mem.txt"}
+    collapsed = (out / [n for n in names if n.endswith(".collapsed")][0]).read_text().splitlines()
+    assert any("_work" in line for line in collapsed)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
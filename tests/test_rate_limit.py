@@ -0,0 +1,91 @@
+import os
+import tempfile
+import pytest
+import requests
+import tweepy
+import bot
+from rate_limit import RateLimiter, RateLimitExceeded
+from twitter_client import TwitterClient, POST_TWEETS
+
+
+def test_budget_follows_headers_and_refills():
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    os.remove(path)
+    try:
+        rl = RateLimiter(state_file=path)
+        assert rl.try_acquire("POST /2/tweets", now=1000)
+
+        headers = {"X-Rate-Limit-Limit": "2", "x-rate-limit-remaining": "0", "x-rate-limit-reset": "2000"}
+        rl.update_from_headers("POST /2/tweets", headers)
+        assert not rl.try_acquire("POST /2/tweets", now=1500)
+        assert rl.next_available("POST /2/tweets", now=1500) == 2000
+
+        # state survives a restart
+        assert RateLimiter(state_file=path).next_available("POST /2/tweets", now=1500) == 2000
+
+        # an expired window is reported as refilled, and the refill is persisted
+        assert RateLimiter(state_file=path).snapshot(now=2001)["POST /2/tweets"]["remaining"] == 2
+        assert RateLimiter(state_file=path).next_available("POST /2/tweets", now=2001) == 2001
+        assert RateLimiter(state_file=path).snapshot(now=0)["POST /2/tweets"]["remaining"] == 2
+
+        # window reset refills to the reported limit
+        assert rl.try_acquire("POST /2/tweets", now=2001)
+        assert rl.snapshot()["POST /2/tweets"]["remaining"] == 1
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_mark_exhausted_without_reset_header():
+    rl = RateLimiter(state_file=None)
+    retry_at = rl.mark_exhausted("POST /2/tweets", {}, now=100)
+    assert retry_at > 100
+    assert not rl.try_acquire("POST /2/tweets", now=101)
+
+
+def test_twitter_client_turns_429_into_rate_limit_exceeded():
+    rl = RateLimiter(state_file=None)
+    tc = TwitterClient("key", "secret", "token", "token-secret", rate_limiter=rl)
+    resp = requests.Response()
+    resp.status_code = 429
+    resp.headers.update({"x-rate-limit-limit": "100", "x-rate-limit-reset": "4102444800"})
+    calls = []
+
+    def create_tweet(**kwargs):
+        calls.append(kwargs)
+        raise tweepy.TooManyRequests(resp)
+
+    tc.client.create_tweet = create_tweet
+    with pytest.raises(RateLimitExceeded) as exc:
+        tc.post_tweet("hello")
+    assert exc.value.retry_at == 4102444800
+    assert len(calls) == 1  # no retries on a rate limit
+    assert tc.next_post_at() == 4102444800
+
+    # the exhausted bucket short-circuits without calling the API
+    with pytest.raises(RateLimitExceeded):
+        tc.post_tweet("again")
+    assert len(calls) == 1
+    assert rl.snapshot()[POST_TWEETS]["remaining"] == 0
+
+
+def test_run_once_drafts_without_posting_while_exhausted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / "products.csv"
+    csv_path.write_text("title,url\nA,https://example.com/a\nB,https://example.com/b\n")
+
+    class LimitedClient:
+        def next_post_at(self):
+            return 4102444800
+
+        def post_tweet(self, text):
+            raise AssertionError("must not post while the budget is exhausted")
+
+    monkeypatch.setattr(bot, "fetch_deals", lambda **kwargs: [])
+    monkeypatch.setattr(bot, "generate_tweets", lambda products: [f"draft {p.url}" for p in products])
+
+    b = bot.Bot(str(csv_path), LimitedClient())
+    assert b.run_once(limit=1) == 4102444800
+    assert list(b.drafts.values()) == ["draft https://example.com/a"]
+    assert b.posted == {}
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import bot
+from snapshot import Snapshot, SNAPSHOT_FILE, publish_snapshot, write_snapshot
+from fetch_deals import write_to_csv
+from utils import Product
+
+
+def test_snapshot_lookup_and_generation():
+    fd, path = tempfile.mkstemp(suffix=".snapshot")
+    os.close(fd)
+    os.remove(path)
+    try:
+        products = [
+            Product(title="Laptop", url="https://example.com/a", price=999.0, deal_price=799.0, currency="$", tags=["tech"]),
+            Product(title="Mouse", url="https://example.com/b"),
+        ]
+        assert write_snapshot(products, {"https://example.com/b": {}}, path) == 1
+        snap = Snapshot(path)
+        assert len(snap) == 2
+        assert snap.get("https://example.com/a") == products[0]
+        assert snap.get("https://example.com/missing") is None
+        assert snap.is_posted("https://example.com/b")
+        assert not snap.is_posted("https://example.com/a")
+        assert not snap.is_stale()
+
+        assert write_snapshot(products, {}, path) == 2
+        assert snap.is_stale()
+        snap = snap.refresh()
+        assert snap.generation == 2
+        assert snap.posted_count == 0
+        snap.close()
+    finally:
+        for p in (path, path + ".lock"):
+            if os.path.exists(p):
+                os.remove(p)
+
+
+def test_fetcher_and_bot_share_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_path = str(tmp_path / "products.csv")
+    # the bot uses the default SNAPSHOT_FILE, relative to the working directory
+    snap_path = SNAPSHOT_FILE
+    row = {"title": "Laptop", "url": "https://example.com/a", "price": "", "deal_price": "", "currency": "", "image_url": "", "tags": ""}
+
+    assert write_to_csv([row], csv_path) == 1
+    assert publish_snapshot(csv_path, {}, snap_path) == 1
+    # dedupe goes through the snapshot index while it matches the CSV
+    monkeypatch.setattr("fetch_deals.load_existing_urls", lambda path: (_ for _ in ()).throw(AssertionError))
+    assert write_to_csv([row], csv_path) == 0
+
+    posts = []
+
+    class Client:
+        def post_tweet(self, text):
+            posts.append(text)
+            return {"id": str(len(posts))}
+
+    monkeypatch.setattr(bot, "fetch_deals", lambda **kwargs: [])
+    monkeypatch.setattr(bot, "generate_tweets", lambda products: [p.url for p in products])
+    b = bot.Bot(csv_path, Client())
+    b.run_once(limit=5)
+    assert posts == ["https://example.com/a"]
+
+    # one publish for the whole run, carrying the posted flag to other readers
+    snap = Snapshot(snap_path)
+    assert snap.generation == 2
+    assert snap.is_posted("https://example.com/a")
+    snap.close()
+    assert b.select_products() == []
+
+
+def test_snapshot_tracks_invalid_rows_and_csv_identity(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_path = str(tmp_path / "products.csv")
+    untitled = {"title": "", "url": "https://example.com/untitled", "price": "", "deal_price": "", "currency": "", "image_url": "", "tags": ""}
+    assert write_to_csv([untitled], csv_path) == 1
+    publish_snapshot(csv_path, {})
+    # an invalid row is never a product, but its URL still counts as already in the CSV
+    snap = Snapshot(SNAPSHOT_FILE)
+    assert "https://example.com/untitled" in snap and len(snap) == 0
+    snap.close()
+    assert write_to_csv([untitled], csv_path) == 0
+
+    # a same-size edit is still noticed
+    with open(csv_path, "w", encoding="utf-8") as fh:
+        fh.write("title,url,deal_price\nLaptop,https://example.com/a,49\n")
+    publish_snapshot(csv_path, {})
+    b = bot.Bot(csv_path, None)
+    assert b.select_products()[0].deal_price == 49.0
+    st = os.stat(csv_path)
+    with open(csv_path, "w", encoding="utf-8") as fh:
+        fh.write("title,url,deal_price\nLaptop,https://example.com/a,39\n")
+    os.utime(csv_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert b.select_products()[0].deal_price == 39.0
+
+    # another CSV gets its own snapshot instead of accepting this one
+    other = tmp_path / "other.csv"
+    other.write_text("title,url,deal_price\nMouse,https://example.com/m,10\n")
+    assert [p.url for p in bot.Bot(str(other), None).select_products()] == ["https://example.com/m"]
+    assert os.path.exists(tmp_path / "other.snapshot")
+    snap = Snapshot(SNAPSHOT_FILE)
+    assert snap.get("https://example.com/a").deal_price == 39.0
+    snap.close()
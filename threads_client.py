@@ -3,24 +3,41 @@
 from dotenv import load_dotenv
 import os
 import time
+import asyncio
 import logging
 import requests
-from typing import Dict, Optional
+from typing import Dict, Iterator, Optional, Tuple
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
 THREADS_API_BASE = "https://graph.threads.net/v1.0"
 
 
-class ThreadsClient:
-    """Post to Threads using the Threads API (two-step: create container → publish).
+# post_tweet retries: attempts, and the first wait (doubled after each failure)
+POST_ATTEMPTS = 3
+POST_BACKOFF_SECONDS = 2
+# Meta recommends a brief pause between creating a container and publishing it
+PUBLISH_DELAY_SECONDS = 1
 
-    Requires in .env:
-      THREADS_USER_ID       — your numeric Threads user ID
-      THREADS_ACCESS_TOKEN  — long-lived access token (valid ~60 days)
-    """
+
+def _retry_waits() -> Iterator[Tuple[int, Optional[float]]]:
+    """Yield (attempt, wait) for each post attempt; `wait` is the pause after a failure,
+    None for the last attempt."""
+    backoff = POST_BACKOFF_SECONDS
+    for attempt in range(1, POST_ATTEMPTS + 1):
+        yield attempt, (backoff if attempt < POST_ATTEMPTS else None)
+        backoff *= 2
+
+
+class _ThreadsAPI:
+    """Credentials and request shapes shared by the blocking and asyncio clients."""
 
     def __init__(
         self,
@@ -41,29 +58,52 @@ class ThreadsClient:
         if missing:
             raise EnvironmentError(f"Missing Threads credentials: {', '.join(missing)}")
 
-    def _create_container(self, text: str) -> str:
-        """Step 1: Create a text media container. Returns the creation_id."""
+    def _container_request(self, text: str) -> Tuple[str, Dict]:
         url = f"{THREADS_API_BASE}/{self.user_id}/threads"
-        params = {
-            "media_type": "TEXT",
-            "text": text,
-            "access_token": self.access_token,
-        }
-        resp = requests.post(url, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+        return url, {"media_type": "TEXT", "text": text, "access_token": self.access_token}
+
+    def _publish_request(self, creation_id: str) -> Tuple[str, Dict]:
+        url = f"{THREADS_API_BASE}/{self.user_id}/threads_publish"
+        return url, {"creation_id": creation_id, "access_token": self.access_token}
+
+    def _me_request(self) -> Tuple[str, Dict]:
+        return f"{THREADS_API_BASE}/me", {"access_token": self.access_token}
+
+    @staticmethod
+    def _creation_id(data: Dict) -> str:
         creation_id = data.get("id")
         if not creation_id:
             raise ValueError(f"No creation_id in response: {data}")
         return creation_id
 
+    @staticmethod
+    def _log_attempt(attempt: int, result: Optional[Dict] = None, error: Optional[Exception] = None):
+        if error is None:
+            logger.info("Threads post published (attempt %d): id=%s", attempt, result.get("id"))
+            return
+        logger.warning("Attempt %d to post to Threads failed: %s", attempt, error)
+        if attempt >= POST_ATTEMPTS:
+            logger.error("Failed to post to Threads after %d attempts", POST_ATTEMPTS)
+
+
+class ThreadsClient(_ThreadsAPI):
+    """Post to Threads using the Threads API (two-step: create container → publish).
+
+    Requires in .env:
+      THREADS_USER_ID       — your numeric Threads user ID
+      THREADS_ACCESS_TOKEN  — long-lived access token (valid ~60 days)
+    """
+
+    def _create_container(self, text: str) -> str:
+        """Step 1: Create a text media container. Returns the creation_id."""
+        url, params = self._container_request(text)
+        resp = requests.post(url, params=params, timeout=15)
+        resp.raise_for_status()
+        return self._creation_id(resp.json())
+
     def _publish_container(self, creation_id: str) -> Dict:
         """Step 2: Publish the container. Returns the API response."""
-        url = f"{THREADS_API_BASE}/{self.user_id}/threads_publish"
-        params = {
-            "creation_id": creation_id,
-            "access_token": self.access_token,
-        }
+        url, params = self._publish_request(creation_id)
         resp = requests.post(url, params=params, timeout=15)
         resp.raise_for_status()
         return resp.json()
@@ -73,36 +113,90 @@ class ThreadsClient:
 
         Named post_tweet for interface compatibility with TwitterClient.
         """
-        attempts = 3
-        backoff = 2
-        last_err = None
-
-        for attempt in range(1, attempts + 1):
+        for attempt, wait in _retry_waits():
             try:
                 creation_id = self._create_container(text)
-                # Brief pause — Meta recommends waiting before publishing
-                time.sleep(1)
+                time.sleep(PUBLISH_DELAY_SECONDS)
                 result = self._publish_container(creation_id)
-                logger.info("Threads post published (attempt %d): id=%s", attempt, result.get("id"))
+                self._log_attempt(attempt, result)
                 return result
             except Exception as e:
-                last_err = e
-                logger.warning("Attempt %d to post to Threads failed: %s", attempt, e)
-                if attempt < attempts:
-                    time.sleep(backoff)
-                    backoff *= 2
-
-        logger.error("Failed to post to Threads after %d attempts", attempts)
-        raise last_err
+                self._log_attempt(attempt, error=e)
+                if wait is None:
+                    raise
+                time.sleep(wait)
 
     def get_me(self) -> Dict:
         """Return basic info about the authenticated Threads user."""
-        url = f"{THREADS_API_BASE}/me"
-        resp = requests.get(url, params={"access_token": self.access_token}, timeout=10)
+        url, params = self._me_request()
+        resp = requests.get(url, params=params, timeout=10)
         resp.raise_for_status()
         return resp.json()
 
 
+class AsyncThreadsClient(_ThreadsAPI):
+    """asyncio variant of ThreadsClient built on aiohttp. Its methods are coroutines, so it
+    is meant for Bot.async_run_once, not the blocking Bot.run_once.
+
+    Pass a shared `aiohttp.ClientSession` to reuse connections across clients;
+    otherwise one is created on first use and closed by `close()`.
+    """
+
+    def __init__(
+        self,
+        user_id: Optional[str] = None,
+        access_token: Optional[str] = None,
+        session: Optional["aiohttp.ClientSession"] = None,
+    ):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed; add it to requirements.txt and install dependencies")
+        super().__init__(user_id=user_id, access_token=access_token)
+        self._session = session
+        self._owns_session = session is None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post(self, url: str, params: Dict) -> Dict:
+        async with self._get_session().post(url, params=params) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def _create_container(self, text: str) -> str:
+        return self._creation_id(await self._post(*self._container_request(text)))
+
+    async def _publish_container(self, creation_id: str) -> Dict:
+        return await self._post(*self._publish_request(creation_id))
+
+    async def post_tweet(self, text: str) -> Dict:
+        """Create and publish a Threads post without blocking the event loop."""
+        for attempt, wait in _retry_waits():
+            try:
+                creation_id = await self._create_container(text)
+                await asyncio.sleep(PUBLISH_DELAY_SECONDS)
+                result = await self._publish_container(creation_id)
+                self._log_attempt(attempt, result)
+                return result
+            except Exception as e:
+                self._log_attempt(attempt, error=e)
+                if wait is None:
+                    raise
+                await asyncio.sleep(wait)
+
+    async def get_me(self) -> Dict:
+        url, params = self._me_request()
+        async with self._get_session().get(url, params=params) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+
 if __name__ == "__main__":
     try:
         tc = ThreadsClient()
@@ -2,8 +2,11 @@ from dotenv import load_dotenv
 import os
 import time
 import logging
+import requests
 from typing import Dict, Optional
 
+from rate_limit import RateLimiter, RateLimitExceeded
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -13,6 +16,10 @@ try:
 except Exception:
     tweepy = None
 
+# Endpoint keys used for per-endpoint rate-limit buckets
+POST_TWEETS = "POST /2/tweets"
+GET_ME = "GET /2/users/me"
+
 
 class TwitterClient:
     """Simple Twitter client using tweepy.Client for v2 endpoints.
@@ -22,6 +29,10 @@ class TwitterClient:
       - TWITTER_API_KEY_SECRET
       - TWITTER_ACCESS_TOKEN
       - TWITTER_ACCESS_TOKEN_SECRET
+
+    Rate limits are tracked by a `RateLimiter` rather than by sleeping inside tweepy:
+    calls on an exhausted endpoint raise `RateLimitExceeded`, and `next_post_at()`
+    tells the scheduler when posting can resume.
     """
 
     def __init__(
@@ -30,6 +41,7 @@ class TwitterClient:
         consumer_secret: Optional[str] = None,
         access_token: Optional[str] = None,
         access_token_secret: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         if tweepy is None:
             raise RuntimeError("tweepy is not installed; add it to requirements.txt and install dependencies")
@@ -53,26 +65,52 @@ class TwitterClient:
         if missing:
             raise EnvironmentError(f"Missing Twitter credentials: {', '.join(missing)}")
 
-        # Create a tweepy.Client instance that can create tweets using OAuth 1.0a credentials
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+        # Create a tweepy.Client instance that can create tweets using OAuth 1.0a credentials.
+        # Raw responses are requested so the x-rate-limit-* headers can be read.
         self.client = tweepy.Client(
             consumer_key=self.consumer_key,
             consumer_secret=self.consumer_secret,
             access_token=self.access_token,
             access_token_secret=self.access_token_secret,
-            wait_on_rate_limit=True,
+            return_type=requests.Response,
+            wait_on_rate_limit=False,
         )
 
+    def _call(self, endpoint: str, method, **kwargs) -> Dict:
+        """Call a tweepy method under the endpoint's budget. Returns the response `data`."""
+        if not self.rate_limiter.try_acquire(endpoint):
+            raise RateLimitExceeded(endpoint, self.rate_limiter.next_available(endpoint))
+        try:
+            resp = method(**kwargs)
+        except tweepy.TooManyRequests as e:
+            retry_at = self.rate_limiter.mark_exhausted(endpoint, e.response.headers)
+            raise RateLimitExceeded(endpoint, retry_at) from e
+        self.rate_limiter.update_from_headers(endpoint, resp.headers)
+        return resp.json().get("data", {})
+
+    def next_post_at(self) -> float:
+        """Epoch time of the next available posting slot (now if budget remains)."""
+        return self.rate_limiter.next_available(POST_TWEETS)
+
     def post_tweet(self, text: str) -> Dict:
-        """Post a text-only tweet. Returns the API response data."""
-        # Retry logic with simple exponential backoff
+        """Post a text-only tweet. Returns the API response data.
+
+        Raises `RateLimitExceeded` immediately when the posting budget is exhausted.
+        """
+        # Retry logic with simple exponential backoff (not applied to rate limits)
         attempts = 3
         backoff = 1
         last_err = None
         for attempt in range(1, attempts + 1):
             try:
-                resp = self.client.create_tweet(text=text)
+                data = self._call(POST_TWEETS, self.client.create_tweet, text=text)
                 logger.info("Tweet posted (attempt %d)", attempt)
-                return resp.data if hasattr(resp, "data") else resp
+                return data
+            except RateLimitExceeded:
+                logger.warning("Posting budget exhausted; not retrying")
+                raise
             except Exception as e:
                 last_err = e
                 logger.warning("Attempt %d to post tweet failed: %s", attempt, e)
@@ -86,8 +124,9 @@ class TwitterClient:
     def reply(self, text: str, in_reply_to_tweet_id: str) -> Dict:
         """Reply to an existing tweet id."""
         try:
-            resp = self.client.create_tweet(text=text, in_reply_to_tweet_id=in_reply_to_tweet_id)
-            return resp.data if hasattr(resp, "data") else resp
+            return self._call(
+                POST_TWEETS, self.client.create_tweet, text=text, in_reply_to_tweet_id=in_reply_to_tweet_id
+            )
         except Exception as e:
             logger.exception("Failed to send reply: %s", e)
             raise
@@ -95,8 +134,7 @@ class TwitterClient:
     def get_me(self) -> Dict:
         """Return the authenticated user information."""
         try:
-            resp = self.client.get_me()
-            return resp.data if hasattr(resp, "data") else resp
+            return self._call(GET_ME, self.client.get_me)
         except Exception as e:
             logger.exception("Failed to fetch authenticated user: %s", e)
             raise
@@ -37,6 +37,41 @@ def _is_valid_url(u: Optional[str]) -> bool:
     return p.scheme in ("http", "https") and bool(p.netloc)
 
 
+def parse_row(row: dict, i: int) -> Tuple[Optional[Product], Optional[str]]:
+    """Validate one CSV row as read by csv.DictReader.
+
+    Returns (product, None), or (None, error) for an invalid row. `i` is the row number used in errors.
+    """
+    # normalize keys to lower-case
+    data = {k.strip().lower(): (v or "").strip() for k, v in row.items()}
+
+    title = data.get("title") or data.get("name")
+    url = data.get("url") or data.get("link")
+
+    if not title:
+        return None, f"Row {i}: missing title"
+    if not url or not _is_valid_url(url):
+        return None, f"Row {i} ({title}): invalid or missing URL: {url}"
+
+    price = _parse_price(data.get("price"))
+    deal_price = _parse_price(data.get("deal_price") or data.get("sale_price"))
+    currency = data.get("currency") or None
+    image_url = data.get("image_url") or data.get("image") or None
+    tags_raw = data.get("tags") or ""
+    tags = [t.strip() for t in tags_raw.split(",") if t.strip()] if tags_raw else None
+
+    prod = Product(
+        title=title,
+        url=url,
+        price=price,
+        deal_price=deal_price,
+        currency=currency,
+        image_url=image_url,
+        tags=tags,
+    )
+    return prod, None
+
+
 def read_products(csv_path: str) -> Tuple[List[Product], List[str]]:
     """Read and validate products from a CSV file.
 
@@ -51,35 +86,10 @@ def read_products(csv_path: str) -> Tuple[List[Product], List[str]]:
     with open(csv_path, newline="", encoding="utf-8-sig") as fh:
         reader = csv.DictReader(fh)
         for i, row in enumerate(reader, start=1):
-            # normalize keys to lower-case
-            data = {k.strip().lower(): (v or "").strip() for k, v in row.items()}
-
-            title = data.get("title") or data.get("name")
-            url = data.get("url") or data.get("link")
-
-            if not title:
-                errors.append(f"Row {i}: missing title")
+            prod, error = parse_row(row, i)
+            if error:
+                errors.append(error)
                 continue
-            if not url or not _is_valid_url(url):
-                errors.append(f"Row {i} ({title}): invalid or missing URL: {url}")
-                continue
-
-            price = _parse_price(data.get("price"))
-            deal_price = _parse_price(data.get("deal_price") or data.get("sale_price"))
-            currency = data.get("currency") or None
-            image_url = data.get("image_url") or data.get("image") or None
-            tags_raw = data.get("tags") or ""
-            tags = [t.strip() for t in tags_raw.split(",") if t.strip()] if tags_raw else None
-
-            prod = Product(
-                title=title,
-                url=url,
-                price=price,
-                deal_price=deal_price,
-                currency=currency,
-                image_url=image_url,
-                tags=tags,
-            )
             products.append(prod)
 
     return products, errors